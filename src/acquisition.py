@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import Scheduler
+
+
+class Engine:
+    '''
+    runs the data acquisition (API polls, sensor reads, writing the
+    history) on one asyncio event loop in a background thread
+    the jobs are timed by a Scheduler, so the loop only wakes up at their
+    deadlines, their blocking calls run in a thread pool, at most
+    max_workers at a time, new data is published to the bus (a DataBus)
+    '''
+    def __init__(self, bus, max_workers=4):
+        self.bus = bus
+        self.max_workers = max_workers
+        self.scheduler = Scheduler(wakeup=self.wake_up)
+        # the calls (func, args) that are running right now
+        self.running = set()
+        self.tasks = set()
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.stopped = None
+        self.semaphore = None
+        self.wakeup = None
+
+    def add_periodic(self, func, interval, *args, delay=0, jitter=0,
+                     topic=None, key=None):
+        '''
+        call the blocking func(*args) every interval seconds (the first time
+        after delay), a call is skipped if the previous one still runs
+        if topic is given results other than None are published with key
+        returns the scheduled Job
+        '''
+        return self.scheduler.call_every(interval, self.spawn, func, args,
+                                         topic, key, delay=delay,
+                                         jitter=jitter)
+
+    def add_later(self, delay, func, *args, topic=None, key=None):
+        '''call the blocking func(*args) once after delay seconds'''
+        return self.scheduler.call_later(delay, self.spawn, func, args,
+                                         topic, key)
+
+    def add_batched(self, func, keys, interval, delays=None, topic=None):
+        '''
+        call the blocking func(key) for every key every interval seconds,
+        delays can set the first delay per key, the calls that are due at
+        the same time run concurrently as one batch
+        if topic is given results other than None are published with the key
+        '''
+        delays = delays or {}
+        return [self.add_periodic(func, interval, key,
+                                  delay=delays.get(key, 0), topic=topic,
+                                  key=key)
+                for key in keys]
+
+    def spawn(self, func, args, topic, key):
+        # called by the scheduler in the thread of the event loop
+        if (func, args) in self.running:
+            logging.warning(f'{func.__qualname__} is still running, '
+                            f'call skipped')
+            return
+        self.running.add((func, args))
+        task = self.loop.create_task(self.call(func, args, topic, key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def call(self, func, args, topic, key):
+        try:
+            result = await self.run_blocking(func, *args)
+        except Exception as e:
+            logging.error(f'{func.__qualname__}{args}: {e!r}')
+        else:
+            if topic is not None and result is not None:
+                self.bus.publish(topic, result, key=key)
+        finally:
+            self.running.discard((func, args))
+
+    async def run_blocking(self, func, *args):
+        '''run a blocking function in the thread pool'''
+        async with self.semaphore:
+            return await self.loop.run_in_executor(self.executor, func,
+                                                   *args)
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.stopped = self.loop.create_future()
+        self.executor = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix='acquisition')
+        self.thread = threading.Thread(target=self.run, name='acquisition')
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+
+    async def main(self):
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+        self.wakeup = asyncio.Event()
+        timer = self.loop.create_task(self.run_scheduler())
+        await self.stopped
+        timer.cancel()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(timer, *self.tasks, return_exceptions=True)
+        # blocking calls can't be cancelled, wait until they returned
+        self.executor.shutdown(wait=True)
+
+    async def run_scheduler(self):
+        while True:
+            self.wakeup.clear()
+            self.scheduler.run_due()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(),
+                                       self.scheduler.timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    def wake_up(self):
+        # jobs can be added from other threads
+        if self.wakeup is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # the loop is already closed
+            pass
+
+    def stop(self, timeout=None):
+        '''cancel all jobs and wait until the engine is stopped'''
+        if self.thread is None:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.set_stopped)
+        except RuntimeError:
+            # the loop is already closed
+            pass
+        self.thread.join(timeout)
+
+    def set_stopped(self):
+        if not self.stopped.done():
+            self.stopped.set_result(None)
@@ -1,22 +1,31 @@
 import pygame as pg
 import pygame.freetype
 import os
-import json
 import inspect
 from itertools import cycle
 import logging
 import threading
-from collections import deque
 
 import clock
 import states
-from weather_api import get_weather_data, get_forecast_data
-from functions import load_weather_codes
+import glyphs
+import assets
+import acquisition
+from bus import DataBus
+from powersave import PowerSave
+from scheduler import Scheduler
+from weather_api import WeatherClient, ResponseCache
+from functions import TextCache, IconCache, celsius
+import history
+from history import History, Checkpointer
 import raspiboard
 
 pygame_error = pg.error
 pygame_quit = pg.quit
 
+# posted by the background threads to wake up the render loop
+DATA_EVENT = pg.event.custom_type()
+
 
 
 class App:
@@ -32,6 +41,8 @@ class App:
         self.should_stop = threading.Event()
         self.window_flags = 0
         self.mouse_visible = True
+        # timers of the render thread, run by update()
+        self.scheduler = Scheduler()
 
         self.daytime_clock = clock.Clock(self, fontsize=settings['clock_size'],
                                          fgcolor=pg.Color('White'))
@@ -48,15 +59,18 @@ class App:
             'digital': pygame.freetype.Font(font_file2),
             'arial': pygame.freetype.SysFont('arial', size=32)
             }
+        # rendered text is shared between all states
+        self.text_cache = TextCache(self.fonts, settings['text_cache_size'])
+        # glyph atlases of the numeric displays per (font, size, colors)
+        self.glyph_atlases = {}
         
-        # load images
-        sprite_files = list(
-            filter(lambda x: x[-3:] == 'png', os.listdir(assets_folder)))
-        sprite_images = {f[:-4]: pg.image.load(
-            os.path.join(assets_folder, f)).convert_alpha()
-                         for f in sprite_files}
+        # load the images and weather codes from the pre-decoded bundle,
+        # the images are converted to surfaces when they are first used
+        sprite_images, self.weather_codes = assets.load_bundle(
+            assets_folder, os.path.join(data_folder, 'condition_codes.csv'),
+            os.path.join(data_folder, 'assets.bundle'))
         # construct the background image
-        self.background_image = sprite_images['background']
+        self.background_image = sprite_images['background.png']
         self.image = pg.Surface(self.background_image.get_size())
         self.image.fill(pg.Color(settings['background_color']))
         self.image.blit(self.background_image, (0, 0))
@@ -67,53 +81,76 @@ class App:
 
         with open(os.path.join(data_folder, 'api_key.txt'), 'r') as f:
             self.weather_api_key = f.read()
-
-        self.city = settings['city']
-        self.outdoor_data_heap = deque()
-        self.forecast_data_heap = deque()
-        self.indoor_data_heap = deque()
-
+        # one pooled connection for all requests to the API, the last
+        # responses are kept on disk and shown first after a start
+        self.weather_client = WeatherClient(
+            self.weather_api_key,
+            connect_timeout=settings['api_connect_timeout'],
+            read_timeout=settings['api_read_timeout'],
+            cache=ResponseCache(os.path.join(data_folder,
+                                             'api_cache.json')),
+            rate_limit=settings['api_rate_limit'])
+
+        # the weather is requested for all locations, Main shows one
+        if 'locations' not in settings:
+            # settings files of the single location version
+            settings['locations'] = [settings['city']]
+        self.locations = settings['locations']
+        self.location_index = 0
+        # new data is published on the bus, every consumer has its own
+        # bounded queue, the render loop is woken up by a DATA_EVENT
+        self.bus = DataBus(notify=self.data_arrived,
+                           maxsize=settings['data_queue_size'])
+        # API polls, sensor reads and writing the history run on one
+        # event loop
+        self.engine = acquisition.Engine(
+            self.bus, max_workers=settings['acquisition_workers'])
+
+        # the indoor sensors, Main shows one
+        if 'sensors' not in settings:
+            # settings files of the single sensor version (a DHT22)
+            settings['sensors'] = [{'pin': settings['device_pin'],
+                                    'model': 'DHT22', 'label': 'indoor'}]
+        self.sensors = settings['sensors']
+        self.sensor_index = 0
+        self.loggers = []
         if raspiboard.RPI:
             # if module runs on Pi
-            self.logger = raspiboard.Logger(self,
-                                            settings['indoor_read_interval'])
+            for sensor in self.sensors:
+                self.loggers.append(raspiboard.Logger(
+                    self, sensor, settings['indoor_read_interval']))
         else:
             # TODO: print "no logger connected" to screen
             pass
 
-        # check if history.json exists and load it
-        self.history_file = os.path.join(data_folder, 'history.json')
-        if os.path.isfile(self.history_file):
-            with open(self.history_file, 'r') as f:
-                self.history = json.load(f)
-        else:
-            self.history = {
-                'outdoor_timestamp': [],
-                'outdoor_temperature': [],
-                'outdoor_humidity': [],
-                'outdoor_weather': [],
-                'indoor_timestamp': [],
-                'indoor_temperature': [],
-                'indoor_humidity': []
-            }
-        self.weather_codes = load_weather_codes(os.path.join(data_folder,
-                                                'condition_codes.csv'))
-
-        # load the corresponding images
-        # get unique weather codes
-        weather_image_names = []
-        for condition in self.weather_codes.values():
-            icon_day = condition['Icon_day'] + '.png'
-            icon_night = icon_day.replace('d', 'n')
-            for icon in [icon_day, icon_night]:
-                if icon not in weather_image_names:
-                    weather_image_names.append(icon)
-
-        self.weather_code_surfaces = {}
-        for filename in weather_image_names:
-            image = pg.image.load(os.path.join(assets_folder,
-                                               filename)).convert_alpha()
-            self.weather_code_surfaces[filename] = image
+        # open the history storage (an old history.json gets imported once)
+        # every location and sensor has its own series
+        series = dict(history.SERIES)
+        for city in self.locations:
+            series[self.outdoor_series(city)] = history.SERIES['outdoor']
+        for sensor in self.sensors:
+            series[self.indoor_series(sensor['label'])] = (
+                history.SERIES['indoor'])
+        self.history = History(os.path.join(data_folder, 'history'),
+                               legacy_file=os.path.join(data_folder,
+                                                        'history.json'),
+                               raw_retention=settings['history_raw_days']
+                               * 86400,
+                               buffer_size=settings['history_buffer_size'],
+                               series=series)
+        self.checkpointer = Checkpointer(
+            self.history, settings['history_sync_interval'],
+            settings['history_checkpoint_interval'])
+        # all samples go into the history, whatever state is shown, so
+        # none of them may be dropped
+        self.history_inbox = self.bus.subscribe('history',
+                                                ('outdoor', 'indoor'),
+                                                lossless=True)
+        # the weather icons are looked up by filename (e.g. '01d.png')
+        # and scaled when they are needed for the first time
+        self.weather_code_surfaces = sprite_images
+        self.icon_cache = IconCache(self.weather_code_surfaces,
+                                    smooth=bool(settings['icon_smoothscale']))
 
         # setup the State Machine
         self.state_dict = {}
@@ -124,14 +161,16 @@ class App:
         
         # what plot to show in the Plots state
         self.show_plot = 'outdoor_temperature'
-
-        # call API once in the beginning
-        t1 = threading.Thread(target=self.process_weather_beginning())
-        t1.start()
+        # the time range of the plot (see Plots.windows)
+        self.plot_window = '24h'
 
         # mirror the event queue
         self.event_queue = []
 
+        # blank the display at night or when nobody uses it
+        self.power_save = PowerSave(settings['sleep_schedule'],
+                                    settings['sleep_inactivity_timeout'])
+
         # for debugging
         self.debug = bool(settings['debug_mode'])
         if self.debug:
@@ -139,9 +178,12 @@ class App:
             next(self.states_cycle)
 
 
-    def events(self):
+    def events(self, first_event=None):
         self.event_queue = []
-        for event in pg.event.get():
+        events = pg.event.get()
+        if first_event is not None and first_event.type != pg.NOEVENT:
+            events.insert(0, first_event)
+        for event in events:
             self.event_queue.append(event)
             if event.type == pg.QUIT:
                 self.running = False
@@ -166,24 +208,134 @@ class App:
                         # cycle the states
                         self.state.next = next(self.states_cycle)
                         self.state.done = True
-            elif event.type == pg.MOUSEBUTTONDOWN:
+            if event.type in (pg.MOUSEBUTTONDOWN, pg.KEYDOWN):
+                self.power_save.user_active()
+            if event.type == pg.MOUSEBUTTONDOWN:
                 if self.settings['log_mouse_position']:
                     mpos = pg.mouse.get_pos()
                     logging.info(f'mouse {int(mpos[0])},{int(mpos[1])}')
 
 
     def update(self, dt):
+        self.scheduler.run_due()
+        self.record_history()
         if self.state.done:
             self.flip_state()
         self.state.update(dt)
 
-        pg.display.set_caption(f'{round(self.clock.get_fps(), 1)}')
+        caption = f'{round(self.clock.get_fps(), 1)}'
+        if self.debug:
+            caption += f'  {self.text_cache.stats()}'
+            caption += f'  {self.weather_client.stats()}'
+            caption += f'  {self.bus.stats()}'
+        pg.display.set_caption(caption)
 
 
     def draw(self):
         self.state.draw(self.screen)
 
 
+    def wait_for_event(self, timeout):
+        '''
+        block until an event arrives or the timeout (in seconds) passed,
+        returns the event or NOEVENT
+        '''
+        if timeout is None:
+            return pg.event.wait()
+        timeout_ms = int(timeout * 1000)
+        if timeout_ms <= 0:
+            return pg.event.poll()
+        return pg.event.wait(timeout_ms)
+
+
+    def frame_timeout(self):
+        '''seconds until the next frame is needed, None if only on events'''
+        if self.state.done:
+            return 0
+        delay = self.state.next_frame_delay()
+        # wake up for the next timer
+        timer = self.scheduler.timeout()
+        if timer is not None:
+            delay = timer if delay is None else min(delay, timer)
+        if delay is None:
+            return None
+        # never faster than the FPS of the current state
+        return max(delay, 1 / self.fps)
+
+
+    def sleep(self):
+        '''
+        blank the display and stop rendering until the display is touched
+        or the sleep time ends, new data still goes into the history
+        '''
+        logging.info('display goes to sleep')
+        self.screen.fill(pg.Color('black'))
+        pg.display.flip()
+        main = self.state_dict['Main']
+        while self.running:
+            event = self.wait_for_event(self.power_save.wake_timeout())
+            if event.type == pg.QUIT:
+                self.running = False
+            elif event.type == DATA_EVENT:
+                self.record_history()
+            elif event.type == pg.MOUSEBUTTONDOWN:
+                # the touch only wakes the display, it isn't passed on
+                self.power_save.user_active()
+                break
+            if not self.power_save.should_sleep():
+                break
+        logging.info('display wakes up')
+        # show the Main state, drawn once from the latest data
+        self.daytime_clock.update_time()
+        if self.state is main:
+            main.redraw()
+        else:
+            self.state.cleanup()
+            previous, self.state_name = self.state_name, 'Main'
+            self.state = main
+            self.state.startup()
+            self.state.previous = previous
+        # the time asleep doesn't count as frame time
+        self.clock.tick()
+
+
+    def record_history(self):
+        '''add the published samples to the history'''
+        messages = self.history_inbox.get_all()
+        for message in messages:
+            data = message.data
+            if message.topic == 'outdoor':
+                self.history.append(
+                    self.outdoor_series(message.key), int(message.time),
+                    temperature=celsius(data['main']['temp']),
+                    humidity=data['main'].get('humidity', None),
+                    weather=history.encode_condition(data['weather'][0]))
+            elif message.topic == 'indoor':
+                self.history.append(
+                    self.indoor_series(message.key), int(message.time),
+                    temperature=data['temperature'],
+                    humidity=data['humidity'])
+        if messages:
+            self.checkpointer.samples_added()
+
+
+    def data_arrived(self):
+        '''called by the background threads after they published data'''
+        try:
+            pg.event.post(pg.event.Event(DATA_EVENT))
+        except pg.error:
+            # pygame was already shut down
+            pass
+
+
+    def glyph_atlas(self, font, size, fgcolor, bgcolor=None):
+        key = (font, size, tuple(fgcolor), tuple(bgcolor) if bgcolor else None)
+        if key not in self.glyph_atlases:
+            self.glyph_atlases[key] = glyphs.GlyphAtlas(self.fonts[font], size,
+                                                        fgcolor, bgcolor)
+        return self.glyph_atlases[key]
+
+
     def setup_states(self):
         # get a dictionary with all classes from the 'states' module
         self.state_dict = dict(inspect.getmembers(states, inspect.isclass))
@@ -222,60 +374,85 @@ class App:
         self.state.redraw()
 
 
-    def process_weather_beginning(self):
-        # get the current weather
-        outdoor_data = get_weather_data(self.weather_api_key,
-                                        self.city)
-        self.outdoor_data_heap.append(outdoor_data)
-        # get the 3 hourly weather forecast
-        forecast_data = get_forecast_data(self.weather_api_key,
-                                          self.city)
-        self.forecast_data_heap.append(forecast_data)
-        # update the screen after receiving information
-        self.state.redraw()
-        
-
-    def process_outdoor_weather(self):
-        while not self.should_stop.wait(self.settings['api_interval_weather']):
-            # get the current weather
-            outdoor_data = get_weather_data(self.weather_api_key,
-                                            self.city)
-            self.outdoor_data_heap.append(outdoor_data)
-
-
-    def process_weather_forecast(self):
-        while not self.should_stop.wait(
-                self.settings['api_interval_forecast']):
-            # get the 3 hourly weather forecast
-            forecast_data = get_forecast_data(self.weather_api_key,
-                                              self.city)
-            self.forecast_data_heap.append(forecast_data)
-    
-    
-    def start_threads(self):
-        t1 = threading.Thread(target=self.process_outdoor_weather)
-        t1.start()
-        t2 = threading.Thread(target=self.process_weather_forecast)
-        t2.start()
-        if raspiboard.RPI:
-            t3 = threading.Thread(target=self.logger.mainloop)
-            t3.start()
+    @property
+    def city(self):
+        '''the location that is shown'''
+        return self.locations[self.location_index]
+
+
+    def outdoor_series(self, city):
+        # the first location keeps the history of the single location version
+        if city == self.locations[0]:
+            return 'outdoor'
+        return history.series_name('outdoor', city)
+
+
+    @property
+    def sensor_label(self):
+        '''the indoor sensor that is shown'''
+        return self.sensors[self.sensor_index]['label']
+
+
+    def indoor_series(self, label):
+        # the first sensor keeps the history of the single sensor version
+        if label == self.sensors[0]['label']:
+            return 'indoor'
+        return history.series_name('indoor', label)
+
+
+    def start_acquisition(self):
+        engine = self.engine
+        client = self.weather_client
+        # the locations are requested in batches, the requests run
+        # concurrently within the limits of the engine and the client
+        # the first requests are sent once the cached responses of the
+        # last run are outdated, until then the screen shows the cache,
+        # the requests return None if the data didn't change
+        interval = self.settings['api_interval_weather']
+        engine.add_batched(
+            client.get_weather_data, self.locations, interval,
+            delays={city: client.expires_in('weather', city, interval)
+                    for city in self.locations},
+            topic='outdoor')
+        interval = self.settings['api_interval_forecast']
+        engine.add_batched(
+            client.get_forecast_data, self.locations, interval,
+            delays={city: client.expires_in('forecast', city, interval)
+                    for city in self.locations},
+            topic='forecast')
+        # write the history to disk in the background
+        self.checkpointer.add_jobs(engine)
+        # the reads of the sensors are spread over the read interval,
+        # so they don't have to wait for each other
+        for i, logger in enumerate(self.loggers):
+            logger.add_jobs(engine, delay=i * logger.read_interval
+                            / len(self.loggers))
+        engine.start()
 
 
     def quit(self):
-        # TODO: save settings etc
-        with open(self.history_file, 'w') as f:
-            json.dump(self.history, f)
-        # stop parallel threads
+        # stop the data acquisition, running sensor reads end early
         self.should_stop.set()
+        self.engine.stop()
+        # TODO: save settings etc
+        self.history.close()
+        self.weather_client.close()
         pg.quit()
 
 
     def run(self):
-        self.start_threads()
+        self.start_acquisition()
+        # draw the first frame right away
+        timeout = 0
         while self.running:
-            dt = self.clock.tick(self.fps) / 1000
-            self.events()
+            if self.power_save.should_sleep():
+                self.sleep()
+                timeout = 0
+                continue
+            # sleep until the next frame is due or something happens
+            self.events(self.wait_for_event(timeout))
+            dt = self.clock.tick() / 1000
             self.update(dt)
             self.draw()
+            timeout = self.frame_timeout()
         self.quit()
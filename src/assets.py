@@ -0,0 +1,106 @@
+import os
+import re
+import pickle
+import hashlib
+import logging
+import pygame as pg
+
+from functions import load_weather_codes
+
+
+# increase when the content of the bundle changes
+BUNDLE_VERSION = 2
+
+# only the images the app shows are bundled (not e.g. the mockups), the
+# weather icons are named after their OpenWeatherMap code, e.g. '01d.png'
+BACKGROUND = 'background.png'
+ICON_PATTERN = re.compile(r'\d\d[dn]\.png')
+
+
+def source_files(assets_folder, codes_file):
+    files = [os.path.join(assets_folder, f)
+             for f in sorted(os.listdir(assets_folder))
+             if f == BACKGROUND or ICON_PATTERN.fullmatch(f)]
+    return files + [codes_file]
+
+
+def signature(files):
+    '''hash over the names, sizes and modification times of the sources'''
+    sha = hashlib.sha1(str(BUNDLE_VERSION).encode())
+    for filename in files:
+        stat = os.stat(filename)
+        sha.update(f'{os.path.basename(filename)}:{stat.st_size}:'
+                   f'{stat.st_mtime_ns};'.encode())
+    return sha.hexdigest()
+
+
+def build_bundle(files, bundle_file, sig):
+    '''decode all images once and store them as raw RGBA data'''
+    images = {}
+    weather_codes = {}
+    for filename in files:
+        if filename.endswith('.png'):
+            surface = pg.image.load(filename)
+            images[os.path.basename(filename)] = (
+                surface.get_size(), pg.image.tostring(surface, 'RGBA'))
+        else:
+            weather_codes = load_weather_codes(filename)
+    bundle = {
+        'signature': sig,
+        'images': images,
+        'weather_codes': weather_codes
+    }
+    with open(bundle_file + '.tmp', 'wb') as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(bundle_file + '.tmp', bundle_file)
+    logging.info(f'built asset bundle with {len(images)} images')
+    return bundle
+
+
+def load_bundle(assets_folder, codes_file, bundle_file):
+    '''
+    load the images and weather codes from the bundle file,
+    the bundle is rebuilt if any of the source files changed
+    returns (LazyImages, weather codes)
+    '''
+    files = source_files(assets_folder, codes_file)
+    sig = signature(files)
+    bundle = None
+    if os.path.isfile(bundle_file):
+        try:
+            with open(bundle_file, 'rb') as f:
+                bundle = pickle.loads(f.read())
+        except (pickle.UnpicklingError, EOFError, ValueError) as e:
+            logging.warning(f'could not read {bundle_file}: {e}')
+    if bundle is None or bundle.get('signature') != sig:
+        bundle = build_bundle(files, bundle_file, sig)
+    return LazyImages(bundle['images']), bundle['weather_codes']
+
+
+class LazyImages:
+    '''
+    images of the bundle by filename (e.g. '01d.png'), a surface is only
+    created from the raw data when it is used for the first time
+    '''
+    def __init__(self, raw):
+        self.raw = raw
+        self.surfaces = {}
+        self.names = set(raw)
+
+    def __getitem__(self, name):
+        if name not in self.surfaces:
+            size, data = self.raw.pop(name)
+            self.surfaces[name] = pg.image.frombuffer(
+                data, size, 'RGBA').convert_alpha()
+        return self.surfaces[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(sorted(self.names))
+
+    def get(self, name, default=None):
+        if name not in self.names:
+            return default
+        return self[name]
@@ -0,0 +1,63 @@
+'''
+measures how long the Plots state needs to prepare its data
+(history query + transformation to screen coordinates)
+usage: python benchmark.py
+'''
+import time
+import shutil
+import tempfile
+from array import array
+from timeit import timeit
+
+import plotting
+from history import History
+
+
+SIZES = [10000, 100000, 1000000]
+# plot rect of the 800x480 window
+PLOT_RECT = (76, 60, 600, 360)
+REPEATS = 5
+
+
+def fill_history(history, size, interval=30):
+    start = int(time.time()) - size * interval
+    timestamps = array('q', range(start, start + size * interval, interval))
+    history['indoor_timestamp'].extend(timestamps)
+    history['indoor_temperature'].extend(
+        20 + (i % 2880) / 288 for i in range(size))
+    history['indoor_humidity'].extend(50 for _ in range(size))
+    return start
+
+
+def enter_plots(history, start, use_numpy):
+    end = time.time()
+    timestamps, values = history.query('indoor_temperature', start, end)
+    y_range = plotting.value_range(values)
+    return plotting.to_screen(timestamps, values, (start, end),
+                              (int(y_range[0]) - 5, int(y_range[1]) + 5),
+                              PLOT_RECT, use_numpy=use_numpy)
+
+
+def main():
+    variants = [('python', False)]
+    if plotting.NUMPY:
+        variants.append(('numpy', True))
+    print(f'{"points":>10}' + ''.join(f'{name:>12}' for name, _ in variants))
+    for size in SIZES:
+        folder = tempfile.mkdtemp()
+        try:
+            history = History(folder, buffer_size=1024)
+            start = fill_history(history, size)
+            results = []
+            for _, use_numpy in variants:
+                seconds = timeit(lambda: enter_plots(history, start, use_numpy),
+                                 number=REPEATS) / REPEATS
+                results.append(f'{seconds * 1000:>10.1f}ms')
+            print(f'{size:>10}' + ''.join(f'{r:>12}' for r in results))
+            history.close()
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import namedtuple, deque, OrderedDict
+
+
+# the data that is published, the data of 'outdoor' and 'forecast' is
+# the API response of the location in key, 'indoor' is a sensor row
+TOPICS = ('outdoor', 'forecast', 'indoor')
+
+Message = namedtuple('Message', ['topic', 'key', 'data', 'time'])
+
+
+class Subscription:
+    '''
+    queue of the messages of some topics for one consumer
+    if the consumer falls behind by more than maxsize messages, the oldest
+    are dropped (and counted), with conflate only the newest message per
+    (topic, key) is kept, e.g. for a display that only shows the latest data
+    a maxsize of None keeps every message, for consumers like the history
+    that must not lose samples
+    '''
+    def __init__(self, name, topics, maxsize=16, conflate=False):
+        self.name = name
+        self.topics = topics
+        self.maxsize = maxsize
+        self.conflate = conflate
+        self.messages = OrderedDict() if conflate else deque()
+        self.lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, message):
+        with self.lock:
+            self.received += 1
+            if self.conflate:
+                self.messages.pop((message.topic, message.key), None)
+                self.messages[(message.topic, message.key)] = message
+                return
+            if self.maxsize is not None and len(self.messages) >= self.maxsize:
+                self.messages.popleft()
+                self.dropped += 1
+            self.messages.append(message)
+
+    def get_all(self):
+        '''take all waiting messages, oldest first'''
+        with self.lock:
+            if self.conflate:
+                messages = list(self.messages.values())
+                self.messages.clear()
+            else:
+                messages = list(self.messages)
+                self.messages.clear()
+        return messages
+
+
+class DataBus:
+    '''
+    producers publish samples to a topic, every subscription of the topic
+    gets them in the order they were published
+    notify is called after every publish (e.g. to wake up the render loop)
+    '''
+    def __init__(self, notify=None, maxsize=16):
+        self.notify = notify
+        self.maxsize = maxsize
+        self.subscriptions = {topic: [] for topic in TOPICS}
+        self.lock = threading.Lock()
+
+    def subscribe(self, name, topics, maxsize=None, conflate=False,
+                  lossless=False):
+        '''
+        maxsize defaults to the maxsize of the bus, a lossless subscription
+        is unbounded and never drops messages
+        '''
+        if lossless:
+            maxsize = None
+        else:
+            maxsize = maxsize or self.maxsize
+        subscription = Subscription(name, topics, maxsize, conflate)
+        with self.lock:
+            for topic in topics:
+                self.subscriptions[topic].append(subscription)
+        return subscription
+
+    def publish(self, topic, data, key=None):
+        if topic not in self.subscriptions:
+            raise ValueError(f'unknown topic {topic}')
+        message = Message(topic, key, data, time.time())
+        with self.lock:
+            subscriptions = list(self.subscriptions[topic])
+        for subscription in subscriptions:
+            subscription.put(message)
+        if self.notify:
+            self.notify()
+
+    def all_subscriptions(self):
+        with self.lock:
+            subscriptions = []
+            for topic_subscriptions in self.subscriptions.values():
+                for subscription in topic_subscriptions:
+                    if subscription not in subscriptions:
+                        subscriptions.append(subscription)
+        return subscriptions
+
+    def stats(self):
+        '''waiting and dropped messages per subscription'''
+        return 'bus: ' + ', '.join(
+            f'{s.name} {len(s)} waiting {s.dropped} dropped'
+            for s in self.all_subscriptions())
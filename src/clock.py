@@ -19,6 +19,10 @@ def get_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
+def get_epoch_time():
+    return int(datetime.datetime.now().timestamp())
+
+
 class Clock:
     def __init__(self, app, fontsize, fgcolor, bgcolor=None):
         self.app = app
@@ -27,6 +31,11 @@ class Clock:
         self.minutes = 0
         self.hours = 0
         self.time_string = ''
+        # the string shown by the current image
+        self.image_string = None
+        # part of the image that changed since it was last drawn
+        # (None if the whole image changed)
+        self.changed_rect = None
         self.synced = False
         self.hour_mode = 24
 
@@ -36,7 +45,7 @@ class Clock:
         self.fgcolor = fgcolor
         self.bgcolor = bgcolor
 
-        # a dictionary of timers for certain events
+        # the jobs of the timers by name, they run on app.scheduler
         self.timers = {}
         self.timer_events = []
 
@@ -50,20 +59,43 @@ class Clock:
         self.hours = time.hour % self.hour_mode + self.minutes / 60
 
     def construct_image(self):
-        font = self.app.fonts['digital_mono']
-        txt = self.time_string
-        self.image, self.rect = font.render(txt,
-                                            fgcolor=self.fgcolor,
-                                            bgcolor=self.bgcolor,
-                                            size=self.fontsize)
+        # only compose a new image if the visible time changed
+        if self.time_string == self.image_string:
+            return
+        atlas = self.app.glyph_atlas('digital_mono', self.fontsize,
+                                     self.fgcolor, self.bgcolor)
+        image, rect = atlas.render(self.time_string)
+        if (self.image_string is not None and self.rect is not None
+                and rect.size == self.rect.size):
+            # only the cells of the characters that changed
+            changed = [i for i, (old, new)
+                       in enumerate(zip(self.image_string, self.time_string))
+                       if old != new]
+            changed_rect = pg.Rect(changed[0] * atlas.cell_width, 0,
+                                   (changed[-1] - changed[0] + 1)
+                                   * atlas.cell_width, rect.h)
+            if self.changed_rect:
+                changed_rect.union_ip(self.changed_rect)
+            self.changed_rect = changed_rect
+            # keep the position of the clock
+            rect.topleft = self.rect.topleft
+        else:
+            self.changed_rect = None
+        self.image, self.rect = image, rect
+        self.image_string = self.time_string
 
     def clear_timer_events(self):
         events = {name: event for name, event in self.timer_events}
-        self.timer_events = []
+        # the list is shared with the scheduled timer jobs
+        self.timer_events.clear()
         return events
 
     def add_timer(self, name, seconds, callback):
-        self.timers[name] = [seconds, 0, callback]
+        '''add (name, callback) to the timer events every seconds'''
+        if name in self.timers:
+            self.timers[name].cancel()
+        self.timers[name] = self.app.scheduler.call_every(
+            seconds, self.timer_events.append, (name, callback))
 
     def update(self, dt, show_seconds=True):
         self.seconds = (self.seconds + dt) % 60
@@ -90,14 +122,13 @@ class Clock:
         else:
             self.synced = False
 
-        # check for elapsed timers
-        for name, timer in self.timers.items():
-            # advance the timer
-            timer[1] += dt
-            # check against the first item
-            if timer[1] >= timer[0]:
-                timer[1] = 0
-                self.timer_events.append((name, timer[2]))
+    def pop_changed_rect(self):
+        '''the changed part of the image in screen coordinates'''
+        changed_rect = self.changed_rect
+        self.changed_rect = None
+        if changed_rect is None:
+            return None
+        return changed_rect.move(self.rect.topleft)
 
     def draw(self, screen, pos, align):
         try:
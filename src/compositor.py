@@ -0,0 +1,69 @@
+import pygame as pg
+
+
+class Compositor:
+    '''
+    composes the screen from a background layer (static content that is
+    redrawn per region) and overlays like the clock that change more often
+    only areas marked as dirty are copied to the screen and updated
+    '''
+    def __init__(self, background):
+        self.background = background
+        # named areas of the background, e.g. the readouts panels
+        self.regions = {}
+        # name: [surface, rect], drawn on top of the background in order
+        self.overlays = {}
+        self.dirty_rects = []
+
+    def add_region(self, name, rect):
+        self.regions[name] = pg.Rect(rect)
+
+    def invalidate(self, rect):
+        self.dirty_rects.append(pg.Rect(rect))
+
+    def invalidate_region(self, name):
+        self.invalidate(self.regions[name])
+
+    def invalidate_all(self):
+        self.invalidate(self.background.get_rect())
+
+    def set_overlay(self, name, image, rect, changed_rect=None):
+        '''
+        set the image of an overlay, changed_rect can limit the update
+        to the part of the image that actually changed
+        '''
+        rect = pg.Rect(rect)
+        if name in self.overlays:
+            old_image, old_rect = self.overlays[name]
+            if old_rect != rect:
+                # the overlay moved or changed its size
+                self.invalidate(old_rect)
+                changed_rect = None
+            elif old_image is image:
+                return
+        self.overlays[name] = [image, rect]
+        self.invalidate(changed_rect or rect)
+
+    def merged_rects(self):
+        # combine overlapping rects so that no area is drawn twice
+        rects = []
+        for rect in self.dirty_rects:
+            index = rect.collidelist(rects)
+            while index != -1:
+                rect.union_ip(rects.pop(index))
+                index = rect.collidelist(rects)
+            rects.append(rect)
+        return rects
+
+    def draw(self, screen):
+        '''draw the dirty areas, returns the rects for display.update'''
+        rects = self.merged_rects()
+        for rect in rects:
+            screen.blit(self.background, rect, rect)
+            screen.set_clip(rect)
+            for image, overlay_rect in self.overlays.values():
+                if overlay_rect.colliderect(rect):
+                    screen.blit(image, overlay_rect)
+            screen.set_clip(None)
+        self.dirty_rects = []
+        return rects
@@ -0,0 +1,130 @@
+from collections import deque
+from statistics import median
+
+
+class Bounds:
+    '''
+    rejects values outside of the physically possible range and the
+    excluded values (e.g. what a sensor reports when it saturates)
+    '''
+    def __init__(self, low, high, exclude=()):
+        self.low = low
+        self.high = high
+        self.exclude = exclude
+
+    def accepts(self, value):
+        return self.low <= value <= self.high and value not in self.exclude
+
+    def update(self, value):
+        return value
+
+
+class Hampel:
+    '''
+    rejects outliers: values that are further than threshold times the
+    scaled median absolute deviation (MAD) of the last window values away
+    from their median, min_deviation keeps a constant signal (MAD of 0)
+    from rejecting every small change
+    rejected outliers are added to the window too, so a real jump in the
+    signal is accepted once it makes up half of the window
+    '''
+    # scales the MAD to the standard deviation of normal distributed values
+    MAD_SCALE = 1.4826
+
+    def __init__(self, window=7, threshold=3, min_deviation=0):
+        self.values = deque(maxlen=window)
+        self.threshold = threshold
+        self.min_deviation = min_deviation
+
+    def seed(self, values):
+        '''start the window with earlier values, e.g. from the history'''
+        self.values.extend(values)
+
+    def accepts(self, value):
+        # the first values can't be judged yet
+        if len(self.values) <= self.values.maxlen // 2:
+            return True
+        center = median(self.values)
+        mad = median(abs(x - center) for x in self.values)
+        deviation = max(self.MAD_SCALE * mad, self.min_deviation)
+        return abs(value - center) <= self.threshold * deviation
+
+    def update(self, value):
+        self.values.append(value)
+        return value
+
+    def reject(self, value):
+        self.values.append(value)
+
+
+class Smoothing:
+    '''
+    exponentially weighted moving average,
+    alpha is the weight of a new value (1 means no smoothing)
+    '''
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+
+    def accepts(self, value):
+        return True
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class FilterChain:
+    '''
+    runs a value through the stages in order, returns the filtered value
+    or None if a stage rejected it, rejected values are counted
+    check() doesn't change the state of the stages, so values that are
+    measured together (e.g. temperature and humidity of one sensor read)
+    can be checked first and then committed or rejected together
+    '''
+    def __init__(self, *stages):
+        self.stages = stages
+        self.accepted = 0
+        self.rejected = 0
+
+    def seed(self, values):
+        for stage in self.stages:
+            if hasattr(stage, 'seed'):
+                stage.seed(values)
+
+    def check(self, value):
+        '''True if every stage accepts the value'''
+        return (value is not None and
+                all(stage.accepts(value) for stage in self.stages))
+
+    def commit(self, value):
+        '''add an accepted value to the stages, returns the filtered value'''
+        for stage in self.stages:
+            value = stage.update(value)
+        self.accepted += 1
+        return value
+
+    def reject(self, value):
+        '''
+        count a value that check() didn't accept, a plausible outlier is
+        still added to the outlier windows, so a real jump is followed
+        '''
+        self.rejected += 1
+        if value is None:
+            return
+        for stage in self.stages:
+            if not stage.accepts(value):
+                if hasattr(stage, 'reject'):
+                    stage.reject(value)
+                return
+
+    def process(self, value):
+        if value is None:
+            return None
+        if self.check(value):
+            return self.commit(value)
+        self.reject(value)
+        return None
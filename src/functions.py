@@ -1,5 +1,6 @@
 import csv
 import logging
+from collections import OrderedDict
 import pygame as pg
 
 
@@ -35,6 +36,73 @@ class UI_Button(pg.sprite.Sprite):
             screen.blit(self.image, self.rect)
 
 
+class TextCache:
+    '''
+    least recently used cache of rendered text surfaces, so that
+    constant labels are only rasterized once
+    '''
+    def __init__(self, fonts, max_size=256):
+        self.fonts = fonts
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        # counters to check how often text has to be rendered
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, fgcolor=None, bgcolor=None, size=0):
+        '''same as freetype.Font.render, but takes the name of the font'''
+        key = (font, text, size,
+               tuple(fgcolor) if fgcolor else None,
+               tuple(bgcolor) if bgcolor else None)
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.surfaces[key] = self.fonts[font].render(
+                text, fgcolor=fgcolor, bgcolor=bgcolor, size=size)
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        surface, rect = self.surfaces[key]
+        # the rect gets moved by the caller
+        return surface, rect.copy()
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return f'text cache: {self.hits} hits, {self.misses} misses ' \
+               f'({hit_rate:.0%})'
+
+
+class IconCache:
+    '''
+    weather icons per (icon code, size, day/night), so that
+    every icon is only scaled once
+    '''
+    def __init__(self, images, smooth=True):
+        # images as loaded from the assets, e.g. {'01d.png': Surface}
+        self.images = images
+        self.smooth = smooth
+        self.surfaces = {}
+
+    def get(self, icon, size=None):
+        '''
+        icon is the name used by the API (e.g. "01n"), size a (w, h) tuple
+        or None for the original size, returns None for unknown icons
+        '''
+        code, night = icon[:2], icon.endswith('n')
+        key = (code, size, night)
+        if key not in self.surfaces:
+            image = self.images.get(f'{code}{"n" if night else "d"}.png')
+            if image is not None and size and image.get_size() != size:
+                if self.smooth:
+                    image = pg.transform.smoothscale(image, size)
+                else:
+                    image = pg.transform.scale(image, size)
+            self.surfaces[key] = image
+        return self.surfaces[key]
+
+
 def celsius(kelvin):
     try:
         return kelvin - 273.15
@@ -0,0 +1,61 @@
+import pygame as pg
+
+
+# characters needed for the clock and the numeric readouts
+CHARACTERS = '0123456789: -.'
+
+
+class GlyphAtlas:
+    '''
+    the characters of a monospaced font, rasterized once for a size and
+    color, strings are composed by blitting the cells next to each other
+    '''
+    def __init__(self, font, size, fgcolor, bgcolor=None,
+                 characters=CHARACTERS):
+        self.font = font
+        self.size = size
+        self.fgcolor = fgcolor
+        self.bgcolor = bgcolor
+
+        # all characters of a monospaced font have the same advance
+        self.cell_width = int(font.get_metrics('0', size=size)[0][4])
+        ascender = font.get_sized_ascender(size)
+        rects = {char: font.get_rect(char, size=size) for char in characters}
+        # crop the cells to the rows that contain any ink,
+        # so the composed text is aligned like a rendered one
+        top = min(ascender - rect.y for rect in rects.values()
+                  if rect.h > 0)
+        bottom = max(ascender - rect.y + rect.h for rect in rects.values()
+                     if rect.h > 0)
+        self.cell_height = bottom - top
+
+        self.cells = {}
+        for char, rect in rects.items():
+            cell = self.new_surface(self.cell_width)
+            if rect.h > 0:
+                font.render_to(cell, (rect.x, ascender - rect.y - top), char,
+                               fgcolor=fgcolor, size=size)
+            self.cells[char] = cell
+
+    def new_surface(self, width):
+        if self.bgcolor:
+            surface = pg.Surface((width, self.cell_height))
+            surface.fill(self.bgcolor)
+        else:
+            surface = pg.Surface((width, self.cell_height), pg.SRCALPHA)
+        return surface
+
+    def render(self, text):
+        '''compose the text from the glyph cells, returns (Surface, Rect)'''
+        if any(char not in self.cells for char in text):
+            # fall back to freetype for other characters
+            return self.font.render(text, fgcolor=self.fgcolor,
+                                    bgcolor=self.bgcolor, size=self.size)
+        surface = self.new_surface(self.cell_width * len(text))
+        # cells don't overlap, transparent cells are copied without
+        # blending so the anti-aliased edges keep their alpha
+        flags = 0 if self.bgcolor else pg.BLEND_RGBA_MAX
+        for i, char in enumerate(text):
+            surface.blit(self.cells[char], (i * self.cell_width, 0),
+                         special_flags=flags)
+        return surface, surface.get_rect()
@@ -0,0 +1,672 @@
+import os
+import re
+import json
+import bisect
+import mmap
+import time
+import logging
+import threading
+from array import array
+from datetime import datetime
+
+
+# column layout of every series (field name -> array typecode)
+# q: 8 byte epoch timestamp, f: float32 value, H: uint16 weather code
+SERIES = {
+    'outdoor': {
+        'timestamp': 'q',
+        'temperature': 'f',
+        'humidity': 'f',
+        'weather': 'H'
+    },
+    'indoor': {
+        'timestamp': 'q',
+        'temperature': 'f',
+        'humidity': 'f'
+    }
+}
+
+# older samples are only kept as aggregates per time bucket
+ROLLUPS = {
+    'hourly': 3600,
+    'daily': 86400
+}
+ROLLUP_STATS = {
+    'min': 'f',
+    'max': 'f',
+    'mean': 'f',
+    'count': 'I'
+}
+
+# weather codes are the OpenWeatherMap condition ids (< 1000),
+# this bit marks conditions that were reported with a night icon
+NIGHT_FLAG = 0x8000
+
+LEGACY_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def encode_condition(weather):
+    '''pack a "weather" entry of the API response into a small int'''
+    code = int(weather.get('id', 0))
+    if weather.get('icon', '').endswith('n'):
+        code |= NIGHT_FLAG
+    return code
+
+
+def decode_condition(code):
+    '''return the condition id and whether it is a night condition'''
+    return code & ~NIGHT_FLAG, bool(code & NIGHT_FLAG)
+
+
+def condition_icon(code, weather_codes):
+    '''return the icon name (e.g. "01n") for a stored weather code'''
+    condition_id, night = decode_condition(code)
+    icon = weather_codes[str(condition_id)]['Icon_day']
+    if night:
+        icon = icon.replace('d', 'n')
+    return icon
+
+
+def series_name(kind, label):
+    '''
+    name of a series of another location or sensor, e.g.
+    series_name('outdoor', 'London,UK') -> 'outdoor-london-uk'
+    '''
+    # no underscores, keys are split at the first one into series and field
+    slug = re.sub('[^a-z0-9]+', '-', label.lower()).strip('-')
+    return f'{kind}-{slug}'
+
+
+def base_key(key):
+    '''
+    the key without location or sensor, e.g.
+    base_key('outdoor-london-uk_humidity') -> 'outdoor_humidity'
+    '''
+    series, field = key.split('_', 1)
+    return f'{series.split("-")[0]}_{field}'
+
+
+def rollup_layout(layout):
+    '''columns of a rollup series, e.g. temperature_min, temperature_max ...'''
+    rollup = {'timestamp': 'q'}
+    for field, typecode in layout.items():
+        if typecode == 'f':
+            for stat, stat_typecode in ROLLUP_STATS.items():
+                rollup[f'{field}_{stat}'] = stat_typecode
+    return rollup
+
+
+def missing_value(typecode):
+    # placeholder for values the API or sensor didn't deliver
+    return float('nan') if typecode == 'f' else 0
+
+
+class RingBuffer:
+    '''
+    fixed size array holding the newest values of a column,
+    the oldest value gets overwritten when the buffer is full
+    '''
+    def __init__(self, typecode, capacity, values=()):
+        self.capacity = max(1, capacity)
+        self.data = array(typecode, values[-self.capacity:])
+        # position of the oldest value once the buffer is full
+        self.start = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.data)
+        if not 0 <= index < len(self.data):
+            raise IndexError('ring buffer index out of range')
+        return self.data[(self.start + index) % len(self.data)]
+
+    def append(self, value):
+        if len(self.data) < self.capacity:
+            self.data.append(value)
+        else:
+            self.data[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def values(self, start=0, stop=None):
+        '''copy of the values in the order they were added'''
+        ordered = self.data[self.start:] + self.data[:self.start]
+        return ordered[start:stop]
+
+
+class Column:
+    '''
+    append-only binary file holding one field of a series
+    the file is memory-mapped on first read, so opening a column
+    does not depend on how many values it holds
+    the newest values are also kept in a ring buffer, reads from that
+    range (e.g. the latest sample) don't touch the file at all
+    '''
+    def __init__(self, filename, typecode, buffer_size=1024):
+        self.filename = filename
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        self.buffer_size = buffer_size
+        self.length = os.path.getsize(filename) // self.itemsize \
+            if os.path.isfile(filename) else 0
+        self.mmap = None
+        self.view = None
+        self.mapped = 0
+
+        self.file = open(filename, 'ab')
+        # cut off a partially written value (e.g. after a power cut)
+        self.truncate(self.length)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        view = self.get_view()
+        for i in range(self.length):
+            yield view[i]
+
+    def __getitem__(self, index):
+        buffer = self.buffer
+        # index of the oldest value in the ring buffer
+        buffered = self.length - len(buffer)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1 and start >= buffered:
+                return buffer.values(start - buffered, stop - buffered)
+            view = self.get_view()
+            result = array(self.typecode)
+            if step == 1:
+                result.frombytes(view[start:stop].cast('B'))
+            else:
+                result.extend(view[start:stop:step].tolist())
+            return result
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('column index out of range')
+        if index >= buffered:
+            return buffer[index - buffered]
+        return self.get_view()[index]
+
+    def get_view(self):
+        # (re-)map the file if values were appended since the last read
+        # an old mapping is not closed explicitly, it is freed as soon as
+        # no other thread reads from it anymore
+        if self.mapped < self.length:
+            with open(self.filename, 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), self.length * self.itemsize,
+                                      access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap).cast(self.typecode)
+            self.mapped = self.length
+        return self.view if self.view is not None else memoryview(b'')
+
+    def release(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.mapped = 0
+
+    def load_buffer(self):
+        # read the newest values from the end of the file
+        count = min(self.length, self.buffer_size)
+        values = array(self.typecode)
+        with open(self.filename, 'rb') as f:
+            f.seek((self.length - count) * self.itemsize)
+            values.fromfile(f, count)
+        self.buffer = RingBuffer(self.typecode, self.buffer_size, values)
+
+    def append(self, value):
+        self.file.write(array(self.typecode, [value]).tobytes())
+        self.file.flush()
+        self.buffer.append(value)
+        self.length += 1
+
+    def extend(self, values):
+        values = array(self.typecode, values)
+        self.file.write(values.tobytes())
+        self.file.flush()
+        for value in values[-self.buffer_size:]:
+            self.buffer.append(value)
+        self.length += len(values)
+
+    def drop(self, count):
+        '''remove the first count values by rewriting the file'''
+        tail = self[count:]
+        with open(self.filename + '.tmp', 'wb') as f:
+            f.write(tail.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(self.filename + '.tmp', self.filename)
+        self.file = open(self.filename, 'ab')
+        self.view = None
+        self.mmap = None
+        self.mapped = 0
+        self.buffer = RingBuffer(self.typecode, self.buffer_size, tail)
+        self.length = len(tail)
+
+    def truncate(self, length):
+        self.release()
+        self.file.truncate(length * self.itemsize)
+        self.file.seek(0, os.SEEK_END)
+        self.length = length
+        self.load_buffer()
+
+    def close(self):
+        self.release()
+        self.file.close()
+
+
+class WriteAheadLog:
+    '''
+    log of the samples appended since the last checkpoint
+    records are json lines: [series, row index, {field: value}]
+    writes are buffered and made durable in batches by sync()
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.old_filename = filename + '.old'
+        self.file = open(filename, 'a')
+        self.unsynced = 0
+
+    def write(self, series, row, values):
+        self.file.write(json.dumps([series, row, values]) + '\n')
+        self.unsynced += 1
+
+    def flush(self):
+        '''flush python's buffer, returns the number of records to fsync'''
+        self.file.flush()
+        unsynced, self.unsynced = self.unsynced, 0
+        return unsynced
+
+    def fsync(self):
+        os.fsync(self.file.fileno())
+
+    def rotate(self):
+        '''start a new log, the old one is kept until the checkpoint is done'''
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.filename, self.old_filename)
+        self.file = open(self.filename, 'a')
+        self.unsynced = 0
+
+    def discard_old(self):
+        if os.path.isfile(self.old_filename):
+            os.remove(self.old_filename)
+
+    def records(self):
+        for filename in [self.old_filename, self.filename]:
+            if not os.path.isfile(filename):
+                continue
+            with open(filename, 'r') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last record was cut off by a crash
+                        logging.warning(f'skipped broken record in {filename}')
+                        break
+
+    def close(self):
+        self.file.close()
+
+
+class Rollup:
+    '''
+    min, max, mean and count of the values of a series per time bucket
+    the running aggregate of the current bucket is kept in memory and
+    written to the rollup columns as soon as the bucket is complete
+    '''
+    def __init__(self, history, series, name, seconds):
+        self.history = history
+        self.series = series
+        self.name = name
+        self.seconds = seconds
+        self.fields = [field for field, typecode
+                       in history.series[series].items()
+                       if typecode == 'f']
+        self.bucket = None
+        self.stats = {}
+
+    def bucket_start(self, timestamp):
+        # align the buckets to local hours/days
+        offset = time.localtime(timestamp).tm_gmtoff
+        return timestamp - (timestamp + offset) % self.seconds
+
+    def add(self, row):
+        bucket = self.bucket_start(row['timestamp'])
+        if bucket != self.bucket:
+            self.write_bucket()
+            self.bucket = bucket
+            self.stats = {field: [float('inf'), float('-inf'), 0.0, 0]
+                          for field in self.fields}
+        for field in self.fields:
+            value = row[field]
+            if value != value:
+                # skip missing values (nan)
+                continue
+            stats = self.stats[field]
+            stats[0] = min(stats[0], value)
+            stats[1] = max(stats[1], value)
+            stats[2] += value
+            stats[3] += 1
+
+    def current(self):
+        '''the aggregates of the unfinished bucket'''
+        row = {'timestamp': self.bucket}
+        for field, (low, high, total, count) in self.stats.items():
+            row[f'{field}_min'] = low if count else float('nan')
+            row[f'{field}_max'] = high if count else float('nan')
+            row[f'{field}_mean'] = total / count if count else float('nan')
+            row[f'{field}_count'] = count
+        return row
+
+    def write_bucket(self):
+        if self.bucket is not None:
+            self.history.write_row(self.name, self.current())
+
+    def resume(self):
+        '''rebuild the unfinished bucket from the raw samples after a restart'''
+        bucket_timestamps = self.history[f'{self.name}_timestamp']
+        if len(bucket_timestamps):
+            start = bucket_timestamps[-1] + self.seconds
+        else:
+            start = float('-inf')
+        timestamps = self.history[f'{self.series}_timestamp']
+        columns = self.history.series_columns(self.series)
+        for i in range(bisect.bisect_left(timestamps, start), len(timestamps)):
+            self.add({field: column[i] for field, column, _ in columns})
+
+
+class History:
+    '''
+    storage engine for the measured values
+    every field of a series is stored in its own column file,
+    columns are accessed like the old history dict,
+    e.g. history['outdoor_temperature']
+    raw samples are kept for raw_retention seconds, older data is only
+    available as hourly and daily rollups, e.g.
+    history['outdoor_hourly_temperature_mean']
+    series maps the names of the raw series to their layouts, e.g. to
+    add the series of other locations with the layout of SERIES['outdoor']
+    '''
+    def __init__(self, folder, legacy_file=None, raw_retention=7 * 86400,
+                 buffer_size=1024, series=SERIES):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        # raw samples are kept for at least a day, so that the rollups
+        # can be rebuilt after a restart
+        self.raw_retention = max(raw_retention, max(ROLLUPS.values()))
+        self.series = dict(series)
+        self.layouts = dict(self.series)
+        self.rollups = {}
+        for series in self.series:
+            self.rollups[series] = []
+            for resolution, seconds in ROLLUPS.items():
+                name = f'{series}_{resolution}'
+                self.layouts[name] = rollup_layout(self.series[series])
+                self.rollups[series].append(
+                    Rollup(self, series, name, seconds))
+
+        self.columns = {}
+        for series, layout in self.layouts.items():
+            for field, typecode in layout.items():
+                key = f'{series}_{field}'
+                self.columns[key] = Column(os.path.join(folder, f'{key}.bin'),
+                                           typecode, buffer_size)
+            self.align(series)
+
+        # appends and reads come from the render thread, checkpoints and
+        # expiring from a background thread, reads take the lock so they
+        # never see a column in the middle of a drop()
+        self.lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.wal = WriteAheadLog(os.path.join(folder, 'wal.log'))
+        self.replay()
+
+        if legacy_file and os.path.isfile(legacy_file):
+            self.migrate(legacy_file)
+
+        for rollups in self.rollups.values():
+            for rollup in rollups:
+                rollup.resume()
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def series_columns(self, series):
+        return [(field, self.columns[f'{series}_{field}'], typecode)
+                for field, typecode in self.layouts[series].items()]
+
+    def length(self, series):
+        return len(self.columns[f'{series}_timestamp'])
+
+    def query(self, key, start, end=None, resolution=None):
+        '''
+        values of a column (e.g. 'outdoor_temperature') with a timestamp
+        between start and end, returns two arrays (timestamps, values)
+        with resolution 'hourly' or 'daily' the rollup means are returned
+        '''
+        series, field = key.split('_', 1)
+        if resolution:
+            series = f'{series}_{resolution}'
+            field = f'{field}_mean'
+        with self.lock:
+            # timestamps are sorted, so the range is found by binary search
+            timestamps = self[f'{series}_timestamp']
+            first = bisect.bisect_left(timestamps, start)
+            if end is None:
+                last = len(timestamps)
+            else:
+                last = bisect.bisect_right(timestamps, end, lo=first)
+            return (timestamps[first:last],
+                    self[f'{series}_{field}'][first:last])
+
+    def latest(self, series):
+        '''the newest sample of a series as a dict, None if it is empty'''
+        with self.lock:
+            if not self.length(series):
+                return None
+            return {field: column[-1]
+                    for field, column, _ in self.series_columns(series)}
+
+    def align(self, series):
+        # a crash in the middle of an append can leave the columns of a
+        # series with different lengths, drop the incomplete row
+        columns = [column for _, column, _ in self.series_columns(series)]
+        length = min(len(column) for column in columns)
+        for column in columns:
+            if len(column) > length:
+                column.truncate(length)
+
+    def append(self, series, timestamp, **values):
+        '''append one sample to a series, e.g. append('indoor', t, temperature=21.5, humidity=40)'''
+        row = {'timestamp': timestamp}
+        for field, typecode in self.series[series].items():
+            if field != 'timestamp':
+                value = values.get(field)
+                row[field] = missing_value(typecode) if value is None else value
+        with self.lock:
+            self.wal.write(series, self.length(series), row)
+            self.write_row(series, row)
+            for rollup in self.rollups[series]:
+                rollup.add(row)
+
+    def write_row(self, series, row):
+        for field, column, _ in self.series_columns(series):
+            column.append(row[field])
+
+    def replay(self):
+        '''append the logged samples that didn't make it into the columns'''
+        replayed = 0
+        for series, index, row in self.wal.records():
+            if series not in self.series or index < self.length(series):
+                continue
+            if index > self.length(series):
+                logging.warning(f'{series} history is missing '
+                                f'{index - self.length(series)} samples')
+            self.write_row(series, row)
+            replayed += 1
+        if replayed:
+            logging.info(f'replayed {replayed} samples from the log')
+        self.checkpoint()
+
+    def sync(self):
+        '''make the logged samples durable'''
+        with self.checkpoint_lock:
+            with self.lock:
+                unsynced = self.wal.flush()
+            if unsynced:
+                self.wal.fsync()
+
+    def checkpoint(self):
+        '''write the columns to disk and start an empty log'''
+        with self.checkpoint_lock:
+            with self.lock:
+                for column in self.columns.values():
+                    column.file.flush()
+                self.wal.rotate()
+            # the slow part happens without blocking appends
+            for column in self.columns.values():
+                os.fsync(column.file.fileno())
+            self.wal.discard_old()
+
+    def expire(self):
+        '''remove raw samples that are older than the retention time'''
+        cutoff = time.time() - self.raw_retention
+        for series in self.series:
+            with self.lock:
+                timestamps = self[f'{series}_timestamp']
+                # only rewrite the files once a day worth of samples expired
+                if not len(timestamps) or timestamps[0] >= cutoff - 86400:
+                    continue
+                count = bisect.bisect_left(timestamps, cutoff)
+            with self.checkpoint_lock:
+                with self.lock:
+                    for column in self.columns.values():
+                        column.file.flush()
+                # the slow part happens without blocking appends and reads
+                for column in self.columns.values():
+                    os.fsync(column.file.fileno())
+                with self.lock:
+                    # the log has to be empty, its row numbers are shifted,
+                    # only the few samples appended since are synced here
+                    for column in self.columns.values():
+                        column.file.flush()
+                        os.fsync(column.file.fileno())
+                    self.wal.rotate()
+                    self.wal.discard_old()
+                    for _, column, _ in self.series_columns(series):
+                        column.drop(count)
+            logging.info(f'removed {count} {series} samples from history')
+
+    def extend(self, series, rows):
+        '''append several samples, rows are dicts with one key per field'''
+        for field, column, typecode in self.series_columns(series):
+            column.extend(missing_value(typecode) if row.get(field) is None
+                          else row[field] for row in rows)
+
+    def migrate(self, legacy_file):
+        '''import a history.json of older versions (only done once)'''
+        if any(self.length(series) for series in SERIES):
+            logging.warning(f'{legacy_file} not imported, history is not empty')
+            return
+        with open(legacy_file, 'r') as f:
+            legacy = json.load(f)
+
+        for series, layout in SERIES.items():
+            rows = []
+            fields = [field for field in layout if field != 'timestamp']
+            for i, time in enumerate(legacy.get(f'{series}_timestamp', [])):
+                row = {'timestamp': int(datetime.strptime(
+                    time, LEGACY_TIME_FORMAT).timestamp())}
+                for field in fields:
+                    values = legacy.get(f'{series}_{field}', [])
+                    value = values[i] if i < len(values) else None
+                    if field == 'weather' and value is not None:
+                        value = encode_condition(value)
+                    row[field] = value
+                rows.append(row)
+            self.extend(series, rows)
+            logging.info(f'migrated {len(rows)} {series} samples')
+
+        self.checkpoint()
+        os.replace(legacy_file, legacy_file + '.migrated')
+
+    def close(self):
+        self.checkpoint()
+        with self.checkpoint_lock:
+            self.wal.close()
+            for column in self.columns.values():
+                column.close()
+
+
+class Checkpointer:
+    '''
+    background jobs that limit how much history a crash can lose:
+    the log is synced sync_interval seconds after new samples were
+    appended and compacted into the column files every
+    checkpoint_interval seconds, expired raw samples are removed at the
+    same time, the jobs run on the acquisition engine
+    '''
+    def __init__(self, history, sync_interval, checkpoint_interval):
+        self.history = history
+        self.sync_interval = sync_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.engine = None
+        # a sync is scheduled or running, at most one of them exists, so
+        # the engine never skips one (see Engine.spawn)
+        self.sync_active = False
+        # samples were appended since the last sync started
+        self.unsynced = False
+        # samples are added in the render thread, syncs run in the engine
+        self.lock = threading.Lock()
+
+    def add_jobs(self, engine):
+        self.engine = engine
+        engine.add_periodic(self.checkpoint, self.checkpoint_interval,
+                            delay=self.checkpoint_interval)
+
+    def samples_added(self):
+        '''called after appends, nothing runs while no samples arrive'''
+        if self.engine is None:
+            return
+        with self.lock:
+            self.unsynced = True
+            if self.sync_active:
+                # the running sync schedules the next one when it's done
+                return
+            self.sync_active = True
+        self.engine.add_later(self.sync_interval, self.sync)
+
+    def sync(self):
+        with self.lock:
+            # samples appended from now on need another sync
+            self.unsynced = False
+        try:
+            self.history.sync()
+        except OSError as e:
+            logging.error(e)
+        finally:
+            with self.lock:
+                self.sync_active = self.unsynced
+            if self.sync_active:
+                self.engine.add_later(self.sync_interval, self.sync)
+
+    def checkpoint(self):
+        try:
+            self.history.checkpoint()
+            self.history.expire()
+        except OSError as e:
+            logging.error(e)
@@ -0,0 +1,109 @@
+import logging
+
+# numpy is optional, without it the pure python version is used
+try:
+    import numpy as np
+    NUMPY = True
+except ModuleNotFoundError as e:
+    logging.info(e)
+    NUMPY = False
+
+
+def value_range(values):
+    '''min and max of the values without nan, None if there are none'''
+    if NUMPY:
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return None
+        return float(values.min()), float(values.max())
+    values = [value for value in values if value == value]
+    if not values:
+        return None
+    return min(values), max(values)
+
+
+def to_screen(x_values, y_values, x_range, y_range, rect, use_numpy=NUMPY):
+    '''
+    map data points to pixel coordinates inside rect (a pygame Rect or a
+    (left, top, width, height) tuple), so that x_range spans the width
+    and y_range the height of the rect (y grows upwards)
+    points with a missing y value (nan) are left out
+    returns a list of (x, y) points for pygame.draw.lines
+    '''
+    left, top, width, height = rect
+    min_x, max_x = x_range
+    min_y, max_y = y_range
+    scale_x = width / ((max_x - min_x) or 1)
+    scale_y = height / ((max_y - min_y) or 1)
+    bottom = top + height
+
+    if use_numpy:
+        x = np.asarray(x_values, dtype=float)
+        y = np.asarray(y_values, dtype=float)
+        valid = ~np.isnan(y)
+        points = np.empty((np.count_nonzero(valid), 2))
+        points[:, 0] = (x[valid] - min_x) * scale_x + left
+        points[:, 1] = bottom - (y[valid] - min_y) * scale_y
+        return points.tolist()
+
+    return [((x - min_x) * scale_x + left, bottom - (y - min_y) * scale_y)
+            for x, y in zip(x_values, y_values) if y == y]
+
+
+def decimate(x_values, y_values, x_range, columns, use_numpy=NUMPY):
+    '''
+    reduce a series to the minimum and maximum of every pixel column,
+    so that at most 2 * columns points remain but all peaks are kept
+    points with a missing y value (nan) are left out
+    returns two lists (x values, y values)
+    '''
+    min_x, max_x = x_range
+    scale = columns / ((max_x - min_x) or 1)
+
+    if use_numpy:
+        x = np.asarray(x_values, dtype=float)
+        y = np.asarray(y_values, dtype=float)
+        valid = ~np.isnan(y)
+        x, y = x[valid], y[valid]
+        if len(x) <= 2 * columns:
+            return x.tolist(), y.tolist()
+        column = np.clip(((x - min_x) * scale).astype(int), 0, columns - 1)
+        # sort by column and value, the first point of a column is its
+        # minimum and the last one its maximum
+        order = np.lexsort((y, column))
+        starts = np.flatnonzero(np.r_[True, np.diff(column[order]) != 0])
+        ends = np.r_[starts[1:], len(order)] - 1
+        lowest, highest = order[starts], order[ends]
+        # keep the original order of the two points within a column
+        indices = np.column_stack((np.minimum(lowest, highest),
+                                   np.maximum(lowest, highest))).ravel()
+        # columns with a single point would contain it twice
+        indices = indices[np.r_[True, np.diff(indices) != 0]]
+        return x[indices].tolist(), y[indices].tolist()
+
+    points = [(x, y) for x, y in zip(x_values, y_values) if y == y]
+    if len(points) <= 2 * columns:
+        return [x for x, _ in points], [y for _, y in points]
+    result_x, result_y = [], []
+    current = None
+    for x, y in points:
+        column = min(max(int((x - min_x) * scale), 0), columns - 1)
+        if column != current:
+            if current is not None:
+                add_column(result_x, result_y, lowest, highest)
+            current = column
+            lowest = highest = (x, y)
+        elif y < lowest[1]:
+            lowest = (x, y)
+        elif y > highest[1]:
+            highest = (x, y)
+    add_column(result_x, result_y, lowest, highest)
+    return result_x, result_y
+
+
+def add_column(result_x, result_y, lowest, highest):
+    # add the extremes of a pixel column in the order they were measured
+    for x, y in sorted({lowest, highest}):
+        result_x.append(x)
+        result_y.append(y)
@@ -0,0 +1,57 @@
+import time
+import datetime
+
+
+def parse_time(string):
+    hours, minutes = string.split(':')
+    return datetime.time(int(hours), int(minutes))
+
+
+class PowerSave:
+    '''
+    decides when the display goes to sleep:
+    during the scheduled times (e.g. [["23:00", "06:30"]]) and, if
+    inactivity_timeout is set, after that many seconds without a touch
+    a touch keeps the display awake for awake_time seconds
+    '''
+    def __init__(self, schedule, inactivity_timeout=0, awake_time=60):
+        self.schedule = [(parse_time(start), parse_time(end))
+                         for start, end in schedule]
+        self.inactivity_timeout = inactivity_timeout
+        self.awake_time = inactivity_timeout or awake_time
+        self.last_activity = time.time()
+
+    def user_active(self):
+        self.last_activity = time.time()
+
+    def scheduled_end(self, now):
+        '''end of the sleep time that contains now, None if there is none'''
+        for start, end in self.schedule:
+            today = now.date()
+            if start <= end:
+                if start <= now.time() < end:
+                    return datetime.datetime.combine(today, end)
+            elif now.time() >= start:
+                # the sleep time continues after midnight
+                return datetime.datetime.combine(
+                    today + datetime.timedelta(days=1), end)
+            elif now.time() < end:
+                return datetime.datetime.combine(today, end)
+        return None
+
+    def should_sleep(self):
+        if time.time() - self.last_activity < self.awake_time:
+            return False
+        if self.inactivity_timeout:
+            return True
+        return self.scheduled_end(datetime.datetime.now()) is not None
+
+    def wake_timeout(self):
+        '''seconds until the display wakes up without a touch (or None)'''
+        if self.inactivity_timeout:
+            return None
+        now = datetime.datetime.now()
+        end = self.scheduled_end(now)
+        if end is None:
+            return 0
+        return (end - now).total_seconds()
@@ -1,10 +1,11 @@
-import time
 from datetime import datetime
-import threading
-from collections import deque
+import time
 import logging
+import threading
 from statistics import mean, median
 
+from filters import FilterChain, Bounds, Hampel, Smoothing
+
 # raspberry pi modules in try:except for testing purpose on a PC
 try:
     import board
@@ -14,36 +15,78 @@ except ModuleNotFoundError as e:
     logging.error(e)
     RPI = False
 
+# DHT sensors are read by bit banging, reads of several sensors at the
+# same time disturb each other's timing, so only one device is read at once
+SENSOR_LOCK = threading.Lock()
+
+# the measuring ranges of the sensor models (temperature, humidity),
+# values outside of them are glitches
+SENSOR_RANGES = {
+    'DHT11': ((0, 50), (0, 100)),
+    'DHT22': ((-40, 80), (0, 100))
+}
+# values the sensors report when they saturate or a read is corrupt,
+# they are never real measurements (a DHT11 measures 0 to 50 C, so
+# these limits can be real readings)
+SENSOR_SATURATION = {
+    'DHT11': ((), ()),
+    'DHT22': ((-40, 80), (0,))
+}
+# changes that are never rejected as outliers (a constant signal has no
+# deviation), about the accuracy of the sensors
+MIN_DEVIATION = {
+    'temperature': 0.5,
+    'humidity': 2
+}
+
 
 class Logger:
-    def __init__(self, app, read_interval, retry_delay=2):
+    '''
+    reads one DHT sensor, sensor is a dict of the "sensors" setting, e.g.
+    {"pin": 4, "model": "DHT22", "label": "living room"}
+    and can override "reading_aggregation" for this sensor
+    '''
+    def __init__(self, app, sensor, read_interval, retry_delay=2):
         self.app = app
         #GPIO.setmode(GPIO.BCM)
         # specifiy the DHT device
-        pin = self.app.settings['device_pin']
-        self.device = adafruit_dht.DHT22(getattr(board, f'D{pin}'))
+        self.label = sensor['label']
+        model = getattr(adafruit_dht, sensor['model'])
+        self.device = model(getattr(board, f'D{sensor["pin"]}'))
         # set the time between reads (ensure its >= 3)
         self.read_interval = max(3, read_interval)
-        self.interval = 0
         self.repeated_readings = self.app.settings['repeated_readings']
+        # reads per cycle, including failed and rejected ones
+        self.max_attempts = 3 * self.repeated_readings
         agggregation_methods = {
             'mean': mean,
             'median': median
             }
-        self.aggregation = agggregation_methods[
-                    self.app.settings['reading_aggregation']]
+        self.aggregation = agggregation_methods[sensor.get(
+            'reading_aggregation', self.app.settings['reading_aggregation'])]
+        # every single read is checked against the last reads before it
+        # is aggregated, so fewer repeated readings are needed
+        self.filters = {}
+        ranges = zip(('temperature', 'humidity'),
+                     SENSOR_RANGES[sensor['model']],
+                     SENSOR_SATURATION[sensor['model']])
+        settings = self.app.settings
+        for field, (low, high), saturation in ranges:
+            stages = [Bounds(low, high, saturation),
+                      Hampel(settings['hampel_window'],
+                             settings['hampel_threshold'],
+                             MIN_DEVIATION[field])]
+            if settings['reading_smoothing'] < 1:
+                stages.append(Smoothing(settings['reading_smoothing']))
+            self.filters[field] = FilterChain(*stages)
         # set the time between an unsuccessful read and the next read
         self.retry_delay = retry_delay
-        # flag that determines which interval is used between reads
+        # flag that shows if the last read was successful
         self.read_successfull = False
-        # set the belay for the main loop
-        self.running_delay = 0.1
-        # saves the time for calculating the delta time beween iterations
-        self.prev_time = time.time()
-        # storage deque for readings
-        self.storage = deque()
-        # task lists (scheduled actions)
+        # scheduled actions (interval, function)
         self.tasks = []
+        # the job of the sensor reads, see add_jobs
+        self.job = None
         # count the times a critical error occurred
         self.error_strikes = 0
         self.strike_threshold = 10
@@ -51,83 +94,120 @@ class Logger:
         self.initialise_shutdown = False
 
 
-    def read_dht(self, delay=0):
-        # thread that sends a request to the DHT11 device after some time
-        time.sleep(delay)  # time waiting at the beginning of the thread
-        while not self.app.should_stop.wait(self.interval):
-            read_counter = 0
-            temperature_values = []
-            humidity_values = []
-            while (read_counter < self.repeated_readings and
-                   not self.app.should_stop.wait(self.retry_delay)):
-                self.read_successfull = False
-                try:
-                    # Print the values to the logfile
-                    temperature_values.append(self.device.temperature)
-                    humidity_values.append(self.device.humidity)
-                    logging.debug((f'{datetime.now().strftime("%H:%M:%S")}  ' +
-                                   f'{self.device.temperature} C, ' +
-                                   f'{round(self.device.humidity)} %'))
-                    # indicate a successfull read and activate the green LED
-                    read_counter += 1
-                    self.read_successfull = True
-                    # reset error count
-                    self.error_strikes = 0
-                except RuntimeError as error:
-                    # check for critical errors
-                    if ('Timed out waiting for PulseIn message' in error.args[0]
-                        or 'DHT sensor not found, check wiring' in error.args[0]):
-                        self.error_strikes += 1
-                        logging.critical(error)
-                    logging.warning(error.args[0])
-                except Exception as e:
-                    logging.error(e)
-                # set the read interval depending on successful reading
-                self.interval = (self.read_interval if self.read_successfull
-                                 else self.retry_delay)
-            # after repeated readings, aggregate 
-            if read_counter >= 1:
-                row = {
-                        'temperature': self.aggregation(temperature_values),
-                        'humidity': self.aggregation(humidity_values)
-                        }
-                # append data to the deque
-                self.storage.append(row)
+    def read_cycle(self):
+        '''
+        read the DHT device until repeated_readings reads were successful
+        or max_attempts reads were made (blocking), returns the aggregated
+        row or None if no read was successful, the app stops or too many
+        errors occurred
+        '''
+        read_counter = 0
+        attempts = 0
+        temperature_values = []
+        humidity_values = []
+        while (read_counter < self.repeated_readings and
+               attempts < self.max_attempts and
+               self.error_strikes < self.strike_threshold and
+               not self.app.should_stop.wait(self.retry_delay)):
+            attempts += 1
+            self.read_successfull = False
+            try:
+                with SENSOR_LOCK:
+                    temperature = self.device.temperature
+                    humidity = self.device.humidity
+                # Print the values to the logfile
+                logging.debug((f'{datetime.now().strftime("%H:%M:%S")}  ' +
+                               f'{self.label}: {temperature} C, ' +
+                               f'{humidity} %'))
+                # a read is only used if both values are plausible,
+                # otherwise neither of them changes the filters
+                values = {'temperature': temperature, 'humidity': humidity}
+                rejected = [field for field, value in values.items()
+                            if not self.filters[field].check(value)]
+                if rejected:
+                    for field in rejected:
+                        self.filters[field].reject(values[field])
+                    # a glitch, read again
+                    logging.warning(f'{self.label}: implausible reading '
+                                    f'rejected ({", ".join(rejected)})')
+                    # a sensor that only delivers implausible values is
+                    # broken as well
+                    self.add_strike()
+                    continue
+                temperature = self.filters['temperature'].commit(temperature)
+                humidity = self.filters['humidity'].commit(humidity)
+                temperature_values.append(temperature)
+                humidity_values.append(humidity)
+                # indicate a successfull read and activate the green LED
+                read_counter += 1
+                self.read_successfull = True
+                # reset error count
+                self.error_strikes = 0
+            except RuntimeError as error:
+                # check for critical errors
+                if ('Timed out waiting for PulseIn message' in error.args[0]
+                    or 'DHT sensor not found, check wiring' in error.args[0]):
+                    logging.critical(error)
+                    self.add_strike()
+                logging.warning(error.args[0])
+            except Exception as e:
+                logging.error(e)
+        if read_counter < self.repeated_readings and attempts >= \
+                self.max_attempts:
+            logging.warning(f'{self.label}: {read_counter} of '
+                            f'{self.repeated_readings} reads successful '
+                            f'after {attempts} attempts')
+        # after repeated readings, aggregate
+        if read_counter >= 1:
+            return {
+                    'temperature': self.aggregation(temperature_values),
+                    'humidity': self.aggregation(humidity_values)
+                    }
+        return None
+
+
+    def add_strike(self):
+        self.error_strikes += 1
+        if self.error_strikes >= self.strike_threshold:
+            # too many errors in a row
+            self.shutdown()
 
 
     def schedule_task(self, time, func):
-        # TODO: make this an object instead of list?
-        self.tasks.append([0, time, func])
-
-
-    def mainloop(self):
-        # start the thread that receives data from the dht device
-        tk_thread = threading.Thread(target=lambda: self.read_dht())
-        tk_thread.start()
-        
-        while not self.app.should_stop.wait(self.running_delay):
-            # calculate how much time passed since the last iteration
-            now = time.time()
-            delta_time = now - self.prev_time
-            self.prev_time = now
-
-            # check for sensor readings
-            if len(self.storage) > 0:
-                row = self.storage.pop()
-                self.app.indoor_data_heap.append(row)
-
-            # check if too many errors occurred in a row
-            if self.error_strikes >= self.strike_threshold:
-                self.shutdown()
-
-            for task in self.tasks:
-                # advance the timer
-                task[0] += self.running_delay
-                # if timer > execution time
-                if task[0] >= task[1]:
-                    task[2]()
+        '''call func every time seconds'''
+        self.tasks.append((time, func))
+
+
+    def seed_filters(self):
+        '''
+        start the outlier windows with the recent history of the sensor,
+        so that the first reads after a restart are checked as well
+        '''
+        series = self.app.indoor_series(self.label)
+        start = time.time() - self.read_interval * self.app.settings[
+            'hampel_window']
+        for field, chain in self.filters.items():
+            _, values = self.app.history.query(f'{series}_{field}', start)
+            # missing values are stored as nan
+            chain.seed([value for value in values if value == value])
+
+
+    def add_jobs(self, engine, delay=0):
+        '''add the sensor reads and the scheduled tasks to the engine'''
+        self.seed_filters()
+        self.job = engine.add_periodic(self.read_cycle, self.read_interval,
+                                       delay=delay, topic='indoor',
+                                       key=self.label)
+        for interval, func in self.tasks:
+            engine.add_periodic(func, interval)
+
 
     def shutdown(self):
-        logging.info('Program terminated')
-        self.app.should_stop.set()
-        self.initialise_shutdown = True
\ No newline at end of file
+        logging.critical(f'stopped reading {self.label}')
+        if self.job:
+            self.job.cancel()
+        # the program ends when no sensor works anymore
+        if all(logger.job.cancelled for logger in self.app.loggers):
+            logging.info('Program terminated')
+            self.app.should_stop.set()
+            self.initialise_shutdown = True
\ No newline at end of file
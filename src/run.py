@@ -29,14 +29,33 @@ DEFAULT_SETTINGS = {
     "clock_size": 96,
     "api_interval_weather": 300,
     "api_interval_forecast": 600,
-    "city": "London,UK",
+    "api_connect_timeout": 5,
+    "api_read_timeout": 10,
+    "locations": ["London,UK"],
+    "location_cycle_time": 0,
+    "api_rate_limit": 60,
     "indoor_read_interval": 30,
     "repeated_readings": 3,
     "reading_aggregation": "median",
-    "device_pin": 4,
+    "hampel_window": 7,
+    "hampel_threshold": 3,
+    "reading_smoothing": 1,
+    "sensors": [{"pin": 4, "model": "DHT22", "label": "indoor"}],
+    "history_sync_interval": 5,
+    "history_checkpoint_interval": 600,
+    "history_raw_days": 7,
+    "history_buffer_size": 2880,
+    "data_queue_size": 16,
+    "acquisition_workers": 4,
+    "text_cache_size": 256,
+    "sleep_schedule": [],
+    "sleep_inactivity_timeout": 0,
+    "icon_smoothscale": 1,
     "plot_ytick_intervals": {
         "outdoor_temperature": 2,
-        "outdoor_humidity": 5
+        "outdoor_humidity": 5,
+        "indoor_temperature": 2,
+        "indoor_humidity": 5
         },
     "debug_mode": 0,
     "log_mouse_position": 0
@@ -67,6 +86,10 @@ def main():
         except UnboundLocalError:
             # if thread Event wasn't initialized yet
             pass
+        else:
+            # wait for the data acquisition and write the unsaved history
+            app.engine.stop()
+            app.history.close()
         # de-initialise pygame on error
         pygame_quit()
 
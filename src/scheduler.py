@@ -0,0 +1,96 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+import threading
+
+
+class Job:
+    '''a scheduled call, cancel() removes it from the scheduler'''
+    def __init__(self, callback, args, interval=None, jitter=0):
+        self.callback = callback
+        self.args = args
+        # None for one-shot jobs
+        self.interval = interval
+        self.jitter = jitter
+        # the planned time of the next call (without jitter)
+        self.deadline = None
+        self.cancelled = False
+
+    def cancel(self):
+        # the job is removed from the heap when it comes up
+        self.cancelled = True
+
+
+class Scheduler:
+    '''
+    one-shot and periodic jobs in a heap ordered by their deadlines,
+    based on a monotonic clock
+    periodic jobs are planned relative to their previous deadline, so they
+    don't drift, calls that were missed (e.g. during a long frame) are
+    skipped, jitter delays every call by a random 0 to jitter seconds
+    run_due() has to be called when timeout() passed, wakeup is called
+    when a job was added that is due before all others (e.g. to interrupt
+    a thread that waits for the timeout)
+    '''
+    def __init__(self, clock=time.monotonic, wakeup=None):
+        self.clock = clock
+        self.wakeup = wakeup
+        self.heap = []
+        # ties are run in the order the jobs were added
+        self.counter = itertools.count()
+        self.lock = threading.RLock()
+
+    def call_later(self, delay, callback, *args):
+        job = Job(callback, args)
+        self.push(job, self.clock() + delay)
+        return job
+
+    def call_every(self, interval, callback, *args, delay=None, jitter=0):
+        '''call every interval seconds, the first time after delay'''
+        job = Job(callback, args, interval, jitter)
+        self.push(job, self.clock() + (interval if delay is None else delay))
+        return job
+
+    def push(self, job, deadline):
+        job.deadline = deadline
+        if job.jitter:
+            deadline += random.uniform(0, job.jitter)
+        with self.lock:
+            heapq.heappush(self.heap, (deadline, next(self.counter), job))
+            earliest = self.heap[0][2] is job
+        if earliest and self.wakeup:
+            self.wakeup()
+
+    def timeout(self):
+        '''seconds until the next job is due, None if there are no jobs'''
+        with self.lock:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            if not self.heap:
+                return None
+            return max(self.heap[0][0] - self.clock(), 0)
+
+    def run_due(self):
+        '''call all jobs whose deadline passed'''
+        now = self.clock()
+        while True:
+            with self.lock:
+                if not self.heap or self.heap[0][0] > now:
+                    return
+                _, _, job = heapq.heappop(self.heap)
+                if job.cancelled:
+                    continue
+                if job.interval:
+                    # plan the next call before this one, so that the
+                    # callback can still cancel the job
+                    deadline = job.deadline + job.interval
+                    if deadline <= now:
+                        missed = int((now - deadline) // job.interval) + 1
+                        deadline += missed * job.interval
+                    self.push(job, deadline)
+            try:
+                job.callback(*job.args)
+            except Exception as e:
+                logging.error(f'{job.callback.__qualname__}: {e!r}')
@@ -1,9 +1,12 @@
+import time
 import datetime
 import pygame as pg
-import logging
 
 import clock
+import compositor
 import functions as func
+import history
+import plotting
 
 
 class State(object):
@@ -34,6 +37,10 @@ class State(object):
     def draw(self):
         pass
 
+    def next_frame_delay(self):
+        '''seconds until the state has to be drawn again without any events'''
+        return 1 / self.app.fps
+
 
 class Main(State):
     """
@@ -44,7 +51,8 @@ class Main(State):
         State.__init__(self, app)
         self.next = 'Plots'
         
-        self.outdoor_data = {
+        # shown for locations without any data
+        self.no_outdoor_data = {
             'main': {},
             'weather': [
                 {
@@ -58,14 +66,58 @@ class Main(State):
             'clouds': {},
             'sys': {}
             }
-        self.forecast_data = {
+        self.no_forecast_data = {
             'list': []
             }
+        # the latest data per location
+        self.outdoor = {}
+        self.forecast = {}
+        # only the newest data is shown, so older messages are replaced
+        self.inbox = self.app.bus.subscribe(
+            'main', ('outdoor', 'forecast', 'indoor'), conflate=True)
         
-        self.indoor_data = {
+        # shown for sensors without any data
+        self.no_indoor_data = {
             'temperature': 88.8,
             'humidity': 88
             }
+        # the latest data per sensor
+        self.indoor = {}
+        # the time of the outdoor data if it is outdated (else None)
+        self.stale_time = None
+
+        # start with the cached responses, until new data arrives
+        weather_client = self.app.weather_client
+        for city in self.app.locations:
+            cached = weather_client.cached('weather', city)
+            if cached:
+                self.outdoor[city] = cached['data']
+            cached = weather_client.cached('forecast', city)
+            if cached:
+                self.forecast[city] = cached['data']
+        for sensor in self.app.sensors:
+            indoor = self.app.history.latest(
+                self.app.indoor_series(sensor['label']))
+            if indoor and indoor['temperature'] == indoor['temperature']:
+                self.indoor[sensor['label']] = {
+                    'temperature': indoor['temperature'],
+                    'humidity': indoor['humidity']}
+        self.stale_time = self.get_stale_time()
+
+        # the redrawn content is kept in app.image, only the changed
+        # areas are copied to the screen
+        screen_rect = self.app.screen_rect
+        self.compositor = compositor.Compositor(self.app.image)
+        # the readouts (down to the humidity labels) fill the columns left
+        # and right of the clock, the forecast ends above the clock
+        self.compositor.add_region('outdoor', (0, 0, 272, screen_rect.h))
+        self.compositor.add_region('indoor', (screen_rect.w - 272, 0,
+                                              272, screen_rect.h))
+        self.compositor.add_region('forecast', (272, 0, screen_rect.w - 544,
+                                                screen_rect.h - 150))
+        self.date_string = ''
+        # seconds since the shown location changed
+        self.location_timer = 0
     
         # user interface elements
         self.ui_elements = pg.sprite.Group()
@@ -79,6 +131,38 @@ class Main(State):
                        position=(140, 320), anchor='center',
                        callback=self.switch_to_plots, 
                        callback_kwargs={'plot': 'outdoor_humidity'})
+        # the city name switches to the next location
+        func.UI_Button(self, image=None,
+                       rect=pg.Rect(0, 0, 240, 48),
+                       position=(screen_rect.centerx, screen_rect.h * 0.58),
+                       anchor='center', callback=self.next_location)
+        # the indoor title switches to the next sensor
+        func.UI_Button(self, image=None,
+                       rect=pg.Rect(0, 0, 240, 56),
+                       position=(screen_rect.w - 136, 48), anchor='center',
+                       callback=self.next_sensor)
+        func.UI_Button(self, image=None,
+                       rect=pg.Rect(0, 0, 160, 100),
+                       position=(screen_rect.w - 140, 130), anchor='center',
+                       callback=self.switch_to_plots,
+                       callback_kwargs={'plot': 'indoor_temperature'})
+        func.UI_Button(self, image=None,
+                       rect=pg.Rect(0, 0, 160, 160),
+                       position=(screen_rect.w - 140, 320), anchor='center',
+                       callback=self.switch_to_plots,
+                       callback_kwargs={'plot': 'indoor_humidity'})
+
+    @property
+    def outdoor_data(self):
+        return self.outdoor.get(self.app.city, self.no_outdoor_data)
+
+    @property
+    def forecast_data(self):
+        return self.forecast.get(self.app.city, self.no_forecast_data)
+
+    @property
+    def indoor_data(self):
+        return self.indoor.get(self.app.sensor_label, self.no_indoor_data)
 
     def startup(self):
         # switch to normal FPS mode
@@ -89,36 +173,20 @@ class Main(State):
         # update the clock (system time, timer events etc
         self.app.daytime_clock.update(dt, show_seconds=False)
         
-        # check for data from api
-        if len(self.app.outdoor_data_heap) >= 1:
-            data = self.app.outdoor_data_heap.pop()
-            self.outdoor_data = data
-
-            time = clock.get_timestamp()
-            temp = func.celsius(data['main'].get('temp', None))
-            humidity = data['main'].get('humidity', None)
-            logging.debug((time, temp))
-            weather = data['weather'][0]
-            self.app.history['outdoor_timestamp'].append(time)
-            self.app.history['outdoor_temperature'].append(temp)
-            self.app.history['outdoor_humidity'].append(humidity)
-            self.app.history['outdoor_weather'].append(weather)
-            self.redraw()
-            
-        if len(self.app.forecast_data_heap) >= 1:
-            data = self.app.forecast_data_heap.pop()
-            self.forecast_data = data
-            self.redraw()
-
-        if len(self.app.indoor_data_heap) >= 1:
-            self.indoor_data = self.app.indoor_data_heap.pop()
-            self.app.history['indoor_timestamp'].append(
-                                clock.get_timestamp())
-            self.app.history['indoor_temperature'].append(
-                            self.indoor_data['temperature'])
-            self.app.history['indoor_humidity'].append(
-                            self.indoor_data['humidity'])
-            self.redraw()
+        regions = self.consume_data()
+        # show the locations in turn
+        cycle_time = self.app.settings['location_cycle_time']
+        if cycle_time and len(self.app.locations) > 1:
+            self.location_timer += dt
+            if self.location_timer >= cycle_time:
+                self.next_location()
+        stale_time = self.get_stale_time()
+        if stale_time != self.stale_time:
+            # the note about outdated data is shown below the city name
+            self.stale_time = stale_time
+            regions.append('forecast')
+        if regions:
+            self.redraw(*regions)
         
         # UI elements
         mpos = pg.mouse.get_pos()
@@ -129,40 +197,71 @@ class Main(State):
         for elem in self.ui_elements:
             elem.update(mpos, mouse_pressed)
 
+    def consume_data(self):
+        '''
+        take the new data from the bus,
+        returns the regions of the screen that need to be redrawn
+        '''
+        regions = []
+        for message in self.inbox.get_all():
+            if message.topic == 'outdoor':
+                # data from the api, only new and valid data is published
+                self.outdoor[message.key] = message.data
+                if message.key == self.app.city:
+                    # the current condition is shown in the forecast region
+                    regions += ['outdoor', 'forecast']
+
+            elif message.topic == 'forecast':
+                self.forecast[message.key] = message.data
+                if message.key == self.app.city:
+                    regions.append('forecast')
+
+            elif message.topic == 'indoor':
+                self.indoor[message.key] = message.data
+                if message.key == self.app.sensor_label:
+                    regions.append('indoor')
+        return list(dict.fromkeys(regions))
+
     def draw(self, screen):
         screen_rect = self.app.screen_rect
-        screen.blit(self.app.image, screen_rect)
-        # draw the time and date
-        # TODO: only draw clock when updated?
-        self.app.daytime_clock.draw(screen,
-                                (screen_rect.centerx,
-                                 screen_rect.h - 120),
-                                'center')
-        self.app.update_rects.append(self.app.daytime_clock.rect.inflate(
-            self.app.daytime_clock.rect.w * 1.5,
-            self.app.daytime_clock.rect.h * 1.5))
+        # the time and date are overlays, they are only drawn if they changed
+        daytime_clock = self.app.daytime_clock
+        daytime_clock.rect.center = (screen_rect.centerx,
+                                     screen_rect.h - 120)
+        self.compositor.set_overlay('clock', daytime_clock.image,
+                                    daytime_clock.rect,
+                                    daytime_clock.pop_changed_rect())
         day = clock.get_weekday()
         date_string = f'{day[0][:3]}  {day[1]:02d}.{day[2]:02d}.{day[3]}'
-        date_txt, date_rect = self.app.fonts['digital_mono'].render(
-                    date_string, fgcolor=pg.Color('white'), size=36)
-        date_rect.center = (screen_rect.centerx,
-                            screen_rect.h - 50)
-        self.app.update_rects.append(date_rect)
-        screen.blit(date_txt, date_rect)
+        if date_string != self.date_string:
+            self.date_string = date_string
+            date_txt, date_rect = self.app.text_cache.render(
+                        'digital_mono', date_string, fgcolor=pg.Color('white'),
+                        size=36)
+            date_rect.center = (screen_rect.centerx,
+                                screen_rect.h - 50)
+            self.compositor.set_overlay('date', date_txt, date_rect)
+
+        self.app.update_rects.extend(self.compositor.draw(screen))
         
         for elem in self.ui_elements:
             elem.draw(screen)
-            self.app.update_rects.append(elem.rect)
             if self.app.debug:
                 pg.draw.rect(screen, pg.Color('red'), elem.rect, 1)
+                self.app.update_rects.append(elem.rect)
 
-        pg.display.update(self.app.update_rects)
+        if self.app.update_rects:
+            pg.display.update(self.app.update_rects)
         # TODO: update_rects as property of state?
         self.app.update_rects = []
                 
 
 
-    def redraw(self):
+    def redraw(self, *regions):
+        '''
+        draw the data into the given regions of the image
+        ('outdoor', 'indoor', 'forecast'), all regions if none are given
+        '''
         # draw the temperatures and humidity
         # TODO: Add temperature to forecast
         # TODO: image as property of state?
@@ -177,7 +276,9 @@ class Main(State):
                 'font': 'digital_mono'
             },
             {
-                'txt': 'INDOOR',
+                # the name of the sensor if there are several
+                'txt': ('INDOOR' if len(self.app.sensors) == 1
+                        else self.app.sensor_label.upper()[:10]),
                 'size': 48,
                 'pos': (screen_rect.w - 136, 48),
                 'anchor': 'center',
@@ -191,7 +292,8 @@ class Main(State):
                 'size': 136,
                 'pos': (160, 166),
                 'anchor': 'bottomright',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             # outdoor temp. after decimal
             {
@@ -200,7 +302,8 @@ class Main(State):
                 'size': 80,
                 'pos': (200, 166),
                 'anchor': 'midbottom',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             # indoor temperature before decimal
             {
@@ -208,7 +311,8 @@ class Main(State):
                 'size': 136,
                 'pos': (screen_rect.w - 108, 168),
                 'anchor': 'bottomright',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             # indoor temperature after decimal
             {
@@ -216,7 +320,8 @@ class Main(State):
                 'size': 80,
                 'pos': (screen_rect.w - 64, 168),
                 'anchor': 'midbottom',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             {
                 'txt': 'TEMPERATURE',
@@ -237,14 +342,16 @@ class Main(State):
                 'size': 136,
                 'pos': (160, 338),
                 'anchor': 'bottomright',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             {
                 'txt': f'{int(self.indoor_data["humidity"])}',
                 'size': 136,
                 'pos': (screen_rect.w - 108, 338),
                 'anchor': 'bottomright',
-                'font': 'digital_mono'
+                'font': 'digital_mono',
+                'atlas': True
             },
             {
                 'txt': 'HUMIDITY',
@@ -261,53 +368,78 @@ class Main(State):
                 'font': 'digital_mono'
             },
         ]
-        self.app.image.blit(self.app.image_original, (0, 0))
-        self.app.update_rects.append(screen_rect)
-        for item in render_positions:
-            font = self.app.fonts[item['font']]
-            txt, rect = font.render(item['txt'],
-                                    fgcolor=pg.Color('white'),
-                                    size=item['size'])
-            # set the rect's position
-            setattr(rect, item['anchor'], item['pos'])
-            self.app.image.blit(txt, rect)
-
+        image = self.app.image
+        if regions:
+            for name in regions:
+                rect = self.compositor.regions[name]
+                image.blit(self.app.image_original, rect, rect)
+                self.compositor.invalidate(rect)
+        else:
+            regions = list(self.compositor.regions)
+            image.blit(self.app.image_original, (0, 0))
+            self.compositor.invalidate_all()
+
+        for name in regions:
+            # nothing is drawn outside of the redrawn region
+            region = self.compositor.regions[name]
+            image.set_clip(region)
+            for item in render_positions:
+                if not region.collidepoint(item['pos']):
+                    continue
+                if item.get('atlas'):
+                    # digits are composed from pre-rasterized glyphs
+                    atlas = self.app.glyph_atlas(item['font'], item['size'],
+                                                 pg.Color('white'))
+                    txt, rect = atlas.render(item['txt'])
+                else:
+                    txt, rect = self.app.text_cache.render(
+                        item['font'], item['txt'], fgcolor=pg.Color('white'),
+                        size=item['size'])
+                # set the rect's position
+                setattr(rect, item['anchor'], item['pos'])
+                image.blit(txt, rect)
+            if name == 'forecast':
+                self.draw_forecast(image, screen_rect)
+        image.set_clip(None)
+
+    def draw_forecast(self, surface, screen_rect):
         # draw the current weather condition
         try:
-            code = self.app.history['outdoor_weather'][-1]['icon'] + '.png'
-            image = self.app.weather_code_surfaces.get(code, None)
-        except IndexError:
+            icon = history.condition_icon(
+                self.app.history.latest(
+                    self.app.outdoor_series(self.app.city))['weather'],
+                self.app.weather_codes)
+            image = self.app.icon_cache.get(icon, (128, 128))
+        except (TypeError, KeyError):
             image = None
         if image:
-            image = pg.transform.scale(image, (128, 128))
             rect = image.get_rect()
             rect.center = (screen_rect.centerx,
                            screen_rect.h * 0.16)
-            self.app.image.blit(image, rect)
+            surface.blit(image, rect)
 
         # draw the 3 hourly forecast
         for i, item in enumerate(self.forecast_data['list'][:6]):
-            code = item['weather'][0]['icon'] + '.png'
-            image = self.app.weather_code_surfaces.get(code, None)
+            image = self.app.icon_cache.get(item['weather'][0]['icon'])
             x_coord = (screen_rect.centerx - 100) + 42 * i
             if image:
                 rect = image.get_rect()
                 rect.center = (x_coord, screen_rect.h * 0.36)
-                self.app.image.blit(image, rect)
+                surface.blit(image, rect)
 
             timestamp = datetime.datetime.utcfromtimestamp(item['dt'])
             time = timestamp.strftime('%H:%M')
-            txt, rect = self.app.fonts['digital'].render(time, fgcolor=pg.Color('white'),
+            txt, rect = self.app.text_cache.render('digital', time, fgcolor=pg.Color('white'),
                                              size=16)
             rect.center = (x_coord, screen_rect.h * 0.42 + 32)
-            self.app.image.blit(txt, rect)
+            surface.blit(txt, rect)
 
             temperature = func.celsius(item['main']['temp'])
-            txt, rect = self.app.fonts['digital'].render(f'{round(temperature)}',
+            txt, rect = self.app.text_cache.render('digital', f'{round(temperature)}',
                                              fgcolor=pg.Color('white'),
                                              size=24)
             rect.center = (x_coord, screen_rect.h * 0.37 + 32)
-            self.app.image.blit(txt, rect)
+            surface.blit(txt, rect)
 
         # draw the city name
         try:
@@ -317,15 +449,56 @@ class Main(State):
                     self.forecast_data['city']['country'])
         except KeyError:
             city_name = 'Could not connect'
-        txt, rect = self.app.fonts['digital'].render(city_name,
+        txt, rect = self.app.text_cache.render('digital', city_name,
                                          fgcolor=pg.Color('white'),
                                          size=36)
         rect.center = (screen_rect.centerx, screen_rect.h * 0.58)
-        self.app.image.blit(txt, rect)
+        surface.blit(txt, rect)
+
+        # tell when the shown data is from an earlier request
+        if self.stale_time is not None:
+            updated = datetime.datetime.fromtimestamp(self.stale_time)
+            txt, rect = self.app.text_cache.render(
+                'digital', updated.strftime('updated %d.%m. %H:%M'),
+                fgcolor=pg.Color('orange'), size=20)
+            rect.center = (screen_rect.centerx, screen_rect.h * 0.64)
+            surface.blit(txt, rect)
+
+    def get_stale_time(self):
+        '''time of the last weather request if it is outdated, else None'''
+        cached = self.app.weather_client.cached('weather', self.app.city)
+        if cached is None:
+            return None
+        # allow one failed request before the data counts as outdated
+        max_age = 2 * self.app.settings['api_interval_weather']
+        if clock.get_epoch_time() - cached['time'] > max_age:
+            return cached['time']
+        return None
         
+    def next_frame_delay(self):
+        # the clock only changes when the next second starts (colon)
+        return 1.01 - self.app.daytime_clock.seconds % 1
+
+    def next_location(self):
+        self.app.location_index = ((self.app.location_index + 1)
+                                   % len(self.app.locations))
+        self.location_timer = 0
+        self.redraw('outdoor', 'forecast')
+
+    def next_sensor(self):
+        self.app.sensor_index = ((self.app.sensor_index + 1)
+                                 % len(self.app.sensors))
+        self.redraw('indoor')
+
     def switch_to_plots(self, plot):
         self.app.state.next = 'Plots'
-        self.app.show_plot = plot
+        # the plots show the history of the shown location or sensor
+        series, field = plot.split('_', 1)
+        if series == 'outdoor':
+            series = self.app.outdoor_series(self.app.city)
+        elif series == 'indoor':
+            series = self.app.indoor_series(self.app.sensor_label)
+        self.app.show_plot = f'{series}_{field}'
         self.app.state.done = True
 
 
@@ -341,12 +514,18 @@ class Plots(State):
         self.background = pg.Surface(self.app.screen_rect.size)
         self.background.fill(
             pg.Color(self.app.settings['background_color']))
+        # static layer with the title, axes and labels, built on startup
+        self.axes_layer = pg.Surface(self.app.screen_rect.size)
+        # the axes layer plus the part of the plot drawn so far
         self.image = pg.Surface(self.app.screen_rect.size)
         self.rect = self.image.get_rect()
         self.plot_rect = self.rect.copy()  # gets changed on startup
+        # areas of the image that changed since the last frame
+        self.dirty_rects = []
 
         self.data = {}
-        self.points_to_draw = []
+        # decimated plot data per (plot, time range, plot width)
+        self.decimated = {}
         # these values are calculated on startup
         self.plot_width = 0
         self.plot_height = 0
@@ -368,6 +547,15 @@ class Plots(State):
         self.animation_done = False
         self.title = '---'
 
+        # time ranges that can be plotted
+        # name: (length in seconds, tick interval, tick label format)
+        self.windows = {
+            '6h': (6 * 3600, 3600, '%H:%M'),
+            '24h': (24 * 3600, 4 * 3600, '%H:%M'),
+            '7d': (7 * 86400, 86400, '%a'),
+            '30d': (30 * 86400, 5 * 86400, '%d.%m')
+        }
+
         # formatting
         # TODO: take these as hex values from settings file
         self.colors = {
@@ -377,29 +565,29 @@ class Plots(State):
         
         # create some buttons for navigation
         self.ui_elements = pg.sprite.Group()
-        txt, rect = self.app.fonts['digital'].render(text='Back',
+        txt, rect = self.app.text_cache.render('digital', text='Back',
                                              fgcolor=self.colors['axis'],
                                              size=self.button_fontsize)
         func.UI_Button(self, image=txt, rect=rect,
                        position=(self.app.settings['window_width'] - 64, 320),
                        anchor='center',
                        callback=self.exit)
+        # buttons for the time range
+        for i, window in enumerate(self.windows):
+            txt, rect = self.app.text_cache.render(
+                                        'digital', text=window,
+                                        fgcolor=self.colors['axis'],
+                                        size=self.axis_label_fontsize * 2)
+            func.UI_Button(self, image=txt, rect=rect,
+                           position=(self.app.settings['window_width'] - 64,
+                                     80 + 50 * i),
+                           anchor='center',
+                           callback=self.set_window,
+                           callback_kwargs={'window': window})
 
     def startup(self):
         # adjust FPS to make the display smoother
         self.app.fps = self.app.settings['FPS_plot_mode']
-        # create plot data from history
-        self.data['y'] = []
-        y_array = self.app.history[self.app.show_plot]
-        self.title = self.app.show_plot.replace('_',' ').title()
-        if 'humidity' in self.app.show_plot:
-            self.max_y = 100
-            self.min_y = 0
-        else:
-            self.max_y = max(y_array) + 5
-            self.min_y = min(y_array) - 5
-        self.max_x = len(y_array) + 1
-        self.min_x = 0
         self.plot_width = int(self.app.settings['window_width'] * 0.75)
         self.plot_height = int(self.app.settings['window_height'] * 0.75)
         self.margin_x = int((self.app.settings['window_width']
@@ -408,17 +596,62 @@ class Plots(State):
                              - self.plot_height) / 2)
         self.plot_rect = pg.Rect(self.margin_x, self.margin_y, 
                                  self.plot_width, self.plot_height)
-
-        for x, y in enumerate(y_array):
-            plot_y = (self.plot_height -
-                      ((y / self.max_y) * self.plot_height) + self.margin_y)
-            plot_x = x * (self.plot_width / len(y_array)) + self.margin_x
-            self.data['y'].append((plot_x, plot_y))
-
+        # create plot data from the history in the selected time range
+        window = self.windows[self.app.plot_window][0]
+        self.max_x = time.time()
+        self.min_x = self.max_x - window
+        timestamps, values = self.get_plot_data(window)
+        self.title = (self.app.show_plot.replace('_', ' ').replace('-', ' ')
+                      .title()
+                      + f'  ({self.app.plot_window})')
+        y_range = plotting.value_range(values)
+        if 'humidity' in self.app.show_plot or y_range is None:
+            self.max_y = 100
+            self.min_y = 0
+        else:
+            self.max_y = int(y_range[1]) + 5
+            self.min_y = int(y_range[0]) - 5
+
+        # transform all points to screen coordinates at once
+        self.data['y'] = plotting.to_screen(timestamps, values,
+                                            (self.min_x, self.max_x),
+                                            (self.min_y, self.max_y),
+                                            self.plot_rect)
+        # nothing to animate without at least one line segment
+        self.animation_done = len(self.data['y']) < 2
+
+        self.draw_axes()
         self.redraw()
 
+    def get_plot_data(self, window):
+        '''
+        the history in the plotted time range, reduced to the extremes of
+        every pixel column (the result is cached until new data arrives or
+        the time range moved by a pixel column)
+        '''
+        key = (self.app.show_plot, self.app.plot_window, self.plot_width)
+        series = self.app.show_plot.split('_')[0]
+        latest = self.app.history.latest(series)
+        # older points would be drawn left of the plot
+        column = int(self.min_x // (window / self.plot_width))
+        version = (latest['timestamp'] if latest else None, column)
+        if key in self.decimated and self.decimated[key][0] == version:
+            return self.decimated[key][1:]
+
+        # windows longer than the raw history use the hourly means
+        if window <= self.app.history.raw_retention:
+            resolution = None
+        else:
+            resolution = 'hourly'
+        timestamps, values = self.app.history.query(
+            self.app.show_plot, self.min_x, self.max_x, resolution)
+        timestamps, values = plotting.decimate(timestamps, values,
+                                               (self.min_x, self.max_x),
+                                               self.plot_width)
+        self.decimated[key] = (version, timestamps, values)
+        return timestamps, values
+
     def cleanup(self):
-        self.points_to_draw = []
         self.drawing_index = 0
         self.animation_done = False
 
@@ -435,23 +668,30 @@ class Plots(State):
             self.timer += dt
             if self.timer >= self.animation_delay:
                 self.timer = 0
-                for i in range(5):
-                    # add 5 points at once
-                    self.points_to_draw.append(
-                        self.data['y'][self.drawing_index]
-                    )
-                    self.drawing_index += 1
-                    if self.drawing_index >= len(
-                            self.data['y']) - 1:
-                        self.animation_done = True
-                        break
-                self.redraw()
+                # add 5 points at once, only the new segments are drawn
+                first = max(self.drawing_index - 1, 0)
+                self.drawing_index = min(self.drawing_index + 5,
+                                         len(self.data['y']))
+                new_points = self.data['y'][first:self.drawing_index]
+                if len(new_points) > 1:
+                    self.dirty_rects.append(
+                        pg.draw.lines(self.image, self.colors['plot'], False,
+                                      new_points, self.plot_thickness))
+                if self.drawing_index >= len(self.data['y']):
+                    self.animation_done = True
+                    # no need for the higher frame rate anymore
+                    self.app.fps = self.app.settings['FPS']
 
     def draw(self, screen):
-        screen.blit(self.image, self.rect)
-        self.app.update_rects.append(self.rect)
+        # only copy the changed parts of the image to the screen
+        for rect in self.dirty_rects:
+            screen.blit(self.image, rect, rect)
+        self.app.update_rects.extend(self.dirty_rects)
+        self.dirty_rects = []
         
         for elem in self.ui_elements:
+            # restore the area below the button before drawing it again
+            screen.blit(self.image, elem.rect, elem.rect)
             elem.draw(screen)
             self.app.update_rects.append(elem.rect)
             if self.app.debug:
@@ -465,39 +705,51 @@ class Plots(State):
         self.app.update_rects = []
 
     def redraw(self):
-        # draw some lines as a test
-        self.image.blit(self.background, (0, 0))
+        # compose the whole image from the layers
+        self.image.blit(self.axes_layer, (0, 0))
+        points = self.data['y'][:self.drawing_index]
+        if len(points) > 1:
+            pg.draw.lines(self.image, self.colors['plot'], False,
+                          points, self.plot_thickness)
+        self.dirty_rects = [self.rect]
+
+    def draw_axes(self):
+        '''render the static parts of the plot into the axes layer'''
+        self.axes_layer.blit(self.background, (0, 0))
         # draw the title
-        txt, rect = self.app.fonts['digital'].render(text=self.title,
+        txt, rect = self.app.text_cache.render('digital', text=self.title,
                                              fgcolor=self.colors['axis'],
                                              size=self.title_fontsize)
         rect.centerx = self.rect.centerx
         rect.bottom = self.plot_rect.top - 4
-        self.image.blit(txt, rect)
+        self.axes_layer.blit(txt, rect)
         # draw the axes
         # x axis
-        pg.draw.line(self.image, self.colors['axis'],
+        pg.draw.line(self.axes_layer, self.colors['axis'],
                      self.plot_rect.bottomleft,
                      self.plot_rect.bottomright,
                      self.axis_thickness)
-        # x tickmarks and labels
-        no_of_ticks = self.max_x
-        for x in range(no_of_ticks + 1):
-            tick_pos_x = x * (self.plot_width / no_of_ticks) + self.margin_x
-            pg.draw.line(self.image, self.colors['axis'],
+        # x tickmarks and labels at full local hours/days
+        _, interval, time_format = self.windows[self.app.plot_window]
+        offset = time.localtime(self.min_x).tm_gmtoff
+        tick = self.min_x - (self.min_x + offset) % interval + interval
+        while tick <= self.max_x:
+            tick_pos_x = ((tick - self.min_x) / (self.max_x - self.min_x)
+                          * self.plot_width + self.margin_x)
+            pg.draw.line(self.axes_layer, self.colors['axis'],
                          (tick_pos_x, self.rect.h - self.margin_y),
                          (tick_pos_x, self.rect.h - self.margin_y
                           + self.tickmark_len))
-            if x % 5 == 0:
-                # TODO: make this value "5" dependent on the len of the array
-                txt, rect = self.app.fonts['digital'].render(text=str(x),
-                                                 fgcolor=self.colors['axis'],
-                                                 size=self.axis_label_fontsize)
-                rect.midtop = (tick_pos_x, self.rect.h - self.margin_y
-                               + self.tickmark_len + 5)
-                self.image.blit(txt, rect)
+            label = datetime.datetime.fromtimestamp(tick).strftime(time_format)
+            txt, rect = self.app.text_cache.render('digital', text=label,
+                                             fgcolor=self.colors['axis'],
+                                             size=self.axis_label_fontsize)
+            rect.midtop = (tick_pos_x, self.rect.h - self.margin_y
+                           + self.tickmark_len + 5)
+            self.axes_layer.blit(txt, rect)
+            tick += interval
         # y axis
-        pg.draw.line(self.image, self.colors['axis'],
+        pg.draw.line(self.axes_layer, self.colors['axis'],
                      self.plot_rect.bottomleft,
                      self.plot_rect.topleft,
                      self.axis_thickness)
@@ -505,20 +757,29 @@ class Plots(State):
         no_of_ticks = int(self.max_y - self.min_y)
         for y in range(no_of_ticks + 1):
             tick_pos_y = y * (self.plot_height / no_of_ticks) + self.margin_y
-            pg.draw.line(self.image, self.colors['axis'],
+            pg.draw.line(self.axes_layer, self.colors['axis'],
                          (self.margin_x - self.tickmark_len, tick_pos_y),
                          (self.margin_x, tick_pos_y))
-            if y % self.app.settings['plot_ytick_intervals'][self.app.show_plot] == 0:
+            if y % self.app.settings['plot_ytick_intervals'][
+                    history.base_key(self.app.show_plot)] == 0:
                 number = str(int(no_of_ticks - y + self.min_y))
-                txt, rect = self.app.fonts['digital'].render(text=number,
+                txt, rect = self.app.text_cache.render('digital', text=number,
                                                  fgcolor=self.colors['axis'],
                                                  size=self.axis_label_fontsize)
                 rect.midright = (self.margin_x - self.tickmark_len - 5, tick_pos_y)
-                self.image.blit(txt, rect)
-        # draw the plot
-        if len(self.points_to_draw) > 1:
-            pg.draw.lines(self.image, self.colors['plot'], False,
-                          self.points_to_draw, self.plot_thickness)
-    
+                self.axes_layer.blit(txt, rect)
+
+    def next_frame_delay(self):
+        if self.animation_done:
+            # the plot is static, only redraw on events
+            return None
+        return self.animation_delay - self.timer
+
+    def set_window(self, window):
+        self.app.plot_window = window
+        # start over with the new time range
+        self.cleanup()
+        self.startup()
+
     def exit(self):
         self.done = True
@@ -1,42 +1,203 @@
+import os
+import time
+import json
+import threading
 import requests
 import logging
+from collections import deque
+from requests.adapters import HTTPAdapter
 
-def get_weather_data(api_key, city_name):
-    base_url = 'https://api.openweathermap.org'
-    complete_url = f'{base_url}/data/2.5/weather?q={city_name}&appid={api_key}'
-    try:
-        response = requests.get(complete_url)
-        logging.debug('received weather data')
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.warning(e)
-        fallback = {
-            'main': {},
-            'weather': [
-                {
-                    'id': 0,
-                    'main': 'Null',
-                    'description': 'Null',
-                    'icon': ''
-                }
-            ],
-            'wind': {},
-            'clouds': {},
-            'sys': {}
-        }
-        return fallback
-
-
-def get_forecast_data(api_key, city_name):
-    base_url = 'https://api.openweathermap.org'
-    complete_url = f'{base_url}/data/2.5/forecast?q={city_name}&appid={api_key}'
-    try:
-        response = requests.get(complete_url)
-        logging.debug('received forecast data')
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.warning(e)
-        fallback = {
-            'list': []
-        }
-        return fallback
+BASE_URL = 'https://api.openweathermap.org'
+
+
+def valid_weather_data(data):
+    # failed requests return an error message of the API
+    return 'temp' in data.get('main', {})
+
+
+def valid_forecast_data(data):
+    return bool(data.get('list'))
+
+
+class RateLimiter:
+    '''
+    allows at most rate calls of acquire() per period seconds,
+    callers that exceed the limit are blocked until it is their turn
+    '''
+    def __init__(self, rate, period=60):
+        self.rate = rate
+        self.period = period
+        # start times of the last calls (and reserved future ones)
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.times and self.times[0] <= now - self.period:
+                self.times.popleft()
+            if len(self.times) >= self.rate:
+                # wait until the oldest call leaves the window
+                start = self.times.popleft() + self.period
+            else:
+                start = now
+            self.times.append(start)
+        if start > now:
+            time.sleep(start - now)
+
+
+class ResponseCache:
+    '''
+    the last valid response of every request with the time it was fetched
+    and the time of the data reported by the API (dt), saved to filename
+    so that a restart doesn't request data that is still up to date
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        if self.filename is None:
+            return {}
+        try:
+            with open(self.filename, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.info(f'no cached responses: {e}')
+            return {}
+
+    def save(self):
+        if self.filename is None:
+            return
+        with open(self.filename + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def get(self, key):
+        '''the entry {'time': ..., 'dt': ..., 'data': ...} or None'''
+        with self.lock:
+            return self.entries.get(key)
+
+    def expires_in(self, key, max_age):
+        '''seconds until the cached response is older than max_age'''
+        entry = self.get(key)
+        if entry is None:
+            return 0
+        return max(entry['time'] + max_age - time.time(), 0)
+
+    def put(self, key, data):
+        '''
+        store a response, returns False if it contains the same data as
+        the cached one (same dt, or the same content if there is no dt)
+        '''
+        dt = data.get('dt')
+        with self.lock:
+            old = self.entries.get(key)
+            if old is None:
+                changed = True
+            elif dt is not None:
+                changed = dt != old['dt']
+            else:
+                changed = data != old['data']
+            self.entries[key] = {'time': time.time(), 'dt': dt, 'data': data}
+            self.save()
+        return changed
+
+
+class WeatherClient:
+    '''
+    sends the requests to the OpenWeatherMap API over one pooled session,
+    so the connection (and TLS handshake) is reused between the polls
+    a request that doesn't connect or answer within the timeouts fails
+    valid responses are kept in the cache (a ResponseCache)
+    at most rate_limit requests per minute are sent (0 for no limit)
+    '''
+    def __init__(self, api_key, connect_timeout=5, read_timeout=10,
+                 base_url=BASE_URL, pool_size=4, cache=None, rate_limit=0):
+        self.api_key = api_key
+        self.cache = cache or ResponseCache()
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # the pollers run in different threads
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.total_latency = 0
+        self.last_latency = None
+
+    def get(self, path, **params):
+        '''send a GET request, returns the decoded json or None on errors'''
+        params['appid'] = self.api_key
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f'{self.base_url}{path}',
+                                        params=params, timeout=self.timeout)
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.warning(e)
+            self.record(time.perf_counter() - start, 0, error=True)
+            return None
+        latency = time.perf_counter() - start
+        self.record(latency, len(response.content))
+        logging.debug(f'received {path} ({len(response.content)} bytes '
+                      f'in {latency * 1000:.0f} ms)')
+        return data
+
+    def record(self, latency, size, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.bytes_received += size
+            self.total_latency += latency
+            self.last_latency = latency
+
+    def stats(self):
+        with self.lock:
+            if not self.requests:
+                return 'api: no requests'
+            mean = self.total_latency / self.requests
+            return f'api: {self.requests} requests, {self.errors} errors, ' \
+                   f'{self.bytes_received / 1024:.0f} kB, ' \
+                   f'{mean * 1000:.0f} ms mean'
+
+    def fetch(self, key, path, valid, **params):
+        '''
+        request new data, returns None if the request failed or
+        the data didn't change since the last request
+        '''
+        data = self.get(path, **params)
+        if data is None or not valid(data):
+            return None
+        if not self.cache.put(key, data):
+            # nothing to parse and draw
+            logging.debug(f'{key} did not change')
+            return None
+        return data
+
+    def cached(self, name, city_name):
+        '''the cache entry of 'weather' or 'forecast' data (or None)'''
+        return self.cache.get(f'{name}:{city_name}')
+
+    def expires_in(self, name, city_name, max_age):
+        return self.cache.expires_in(f'{name}:{city_name}', max_age)
+
+    def get_weather_data(self, city_name):
+        return self.fetch(f'weather:{city_name}', '/data/2.5/weather',
+                          valid_weather_data, q=city_name)
+
+    def get_forecast_data(self, city_name):
+        return self.fetch(f'forecast:{city_name}', '/data/2.5/forecast',
+                          valid_forecast_data, q=city_name)
+
+    def close(self):
+        self.session.close()
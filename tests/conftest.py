@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules in src are imported by their name, like run.py does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
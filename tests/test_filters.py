@@ -0,0 +1,29 @@
+from filters import FilterChain, Bounds, Hampel, Smoothing
+
+
+def test_saturation_values_are_rejected():
+    chain = FilterChain(Bounds(-40, 80, (-40, 80)), Hampel(7, 3, 0.5))
+    assert [chain.process(v) for v in [-40, -40, 21, 21]] == \
+        [None, None, 21, 21]
+    assert chain.rejected == 2
+
+
+def test_seeded_window_judges_the_first_values():
+    chain = FilterChain(Bounds(-40, 80), Hampel(7, 3, 0.5))
+    chain.seed([21.0, 21.1, 21.0, 21.2])
+    assert chain.process(35) is None
+    assert chain.process(21.1) == 21.1
+
+
+def test_real_jump_is_followed():
+    chain = FilterChain(Bounds(-40, 80), Hampel(7, 3, 0.5))
+    results = [chain.process(v) for v in [20] * 7 + [25] * 5]
+    assert results[-1] == 25
+
+
+def test_check_does_not_change_the_state():
+    chain = FilterChain(Bounds(-40, 80), Hampel(7, 3, 0.5), Smoothing(0.5))
+    assert chain.check(22)
+    assert not chain.stages[1].values
+    assert chain.stages[2].value is None
+    assert chain.accepted == 0
@@ -0,0 +1,68 @@
+import time
+import threading
+
+from acquisition import Engine
+from bus import DataBus
+from history import History, Checkpointer
+
+
+class SlowHistory:
+    '''counts the syncs, each one takes longer than the sync interval'''
+    def __init__(self):
+        self.syncs = 0
+
+    def sync(self):
+        self.syncs += 1
+        time.sleep(0.3)
+
+
+def test_samples_during_a_sync_are_synced_later():
+    history = SlowHistory()
+    checkpointer = Checkpointer(history, 0.1, 3600)
+    engine = Engine(DataBus())
+    checkpointer.engine = engine
+    engine.start()
+    try:
+        checkpointer.samples_added()
+        time.sleep(0.2)
+        # the first sync is running
+        checkpointer.samples_added()
+        time.sleep(0.8)
+        assert history.syncs == 2
+        assert not checkpointer.sync_active
+        # later samples start a new sync
+        checkpointer.samples_added()
+        time.sleep(0.6)
+        assert history.syncs == 3
+    finally:
+        engine.stop()
+
+
+def test_expire_while_reading(tmp_path):
+    history = History(str(tmp_path), raw_retention=86400)
+    now = int(time.time())
+    for i in range(3000):
+        history.append('indoor', now - 3 * 86400 + i * 80,
+                       temperature=20.0, humidity=40.0)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                history.query('indoor_temperature', 0)
+                history.latest('indoor')
+            except Exception as e:
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    history.expire()
+    stop.set()
+    reader.join()
+    assert not errors
+    timestamps, _ = history.query('indoor_temperature', 0)
+    assert timestamps[0] >= now - 86400 - 80
+    assert history.latest('indoor')['timestamp'] == now - 3 * 86400 + 2999 * 80
+    history.close()
@@ -0,0 +1,54 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import raspiboard
+
+
+class FakeDevice:
+    def __init__(self, pin, temperature=21.0, humidity=40.0):
+        self.temperature = temperature
+        self.humidity = humidity
+
+
+@pytest.fixture
+def make_logger(monkeypatch):
+    monkeypatch.setattr(raspiboard, 'board',
+                        SimpleNamespace(D4=4), raising=False)
+    monkeypatch.setattr(raspiboard, 'adafruit_dht',
+                        SimpleNamespace(DHT11=FakeDevice, DHT22=FakeDevice),
+                        raising=False)
+
+    def make_logger(model, temperature, humidity):
+        app = SimpleNamespace(should_stop=threading.Event(), loggers=[],
+                              settings={'repeated_readings': 3,
+                                        'reading_aggregation': 'median',
+                                        'hampel_window': 7,
+                                        'hampel_threshold': 3,
+                                        'reading_smoothing': 1})
+        logger = raspiboard.Logger(app, {'pin': 4, 'model': model,
+                                         'label': 'test'}, 3, retry_delay=0)
+        logger.device.temperature = temperature
+        logger.device.humidity = humidity
+        logger.job = SimpleNamespace(cancelled=False)
+        logger.job.cancel = lambda: setattr(logger.job, 'cancelled', True)
+        app.loggers.append(logger)
+        return logger
+    return make_logger
+
+
+def test_range_limits_of_dht11_are_valid(make_logger):
+    logger = make_logger('DHT11', 0.0, 96.0)
+    assert logger.read_cycle() == {'temperature': 0.0, 'humidity': 96.0}
+
+
+def test_rejected_reads_are_limited_and_escalated(make_logger):
+    logger = make_logger('DHT22', -40.0, 40.0)
+    assert logger.read_cycle() is None
+    assert logger.error_strikes == logger.max_attempts
+    # the strikes add up over the cycles until the sensor is given up
+    for _ in range(3):
+        logger.read_cycle()
+    assert logger.job.cancelled
+    assert logger.app.should_stop.is_set()
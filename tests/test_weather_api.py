@@ -0,0 +1,69 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from weather_api import WeatherClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1 and a Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.clients.append(self.client_address)
+        if self.path.startswith('/slow'):
+            time.sleep(self.server.slow_delay)
+        body = json.dumps({'dt': 1, 'main': {'temp': 290}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.clients = []
+    server.slow_delay = 1
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **kwargs):
+    host, port = server.server_address
+    return WeatherClient('key', base_url=f'http://{host}:{port}', **kwargs)
+
+
+def test_connection_is_reused(server):
+    client = make_client(server)
+    assert client.get('/data') == {'dt': 1, 'main': {'temp': 290}}
+    assert client.get('/data') is not None
+    client.close()
+    assert len(server.clients) == 2
+    # the same client port means the same TCP connection
+    assert server.clients[0] == server.clients[1]
+    assert client.requests == 2
+    assert client.errors == 0
+
+
+def test_slow_response_times_out(server):
+    client = make_client(server, read_timeout=0.2)
+    start = time.perf_counter()
+    assert client.get('/slow') is None
+    elapsed = time.perf_counter() - start
+    client.close()
+    assert elapsed < server.slow_delay
+    assert client.errors == 1
+    assert client.stats().startswith('api: 1 requests, 1 errors')
+